@@ -0,0 +1,248 @@
+"""
+Benchmarks for the hot paths of the guest user lifecycle.
+
+Run them from the repository root against an in-memory SQLite database::
+
+    python -m benchmarks
+    python -m benchmarks --sizes 10000 --iterations 500
+    python -m benchmarks --generator guest_user.functions.generate_numbered_username
+
+For each table size, the guest table is filled with that many guests before
+the benchmarks run. Throughput and the number of queries per operation are
+reported for every benchmark.
+
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_proj.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.contrib.sessions.backends.db import SessionStore  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+from guest_user.backends import GuestBackend  # noqa: E402
+from guest_user.forms import UserCreationForm  # noqa: E402
+from guest_user.functions import (  # noqa: E402
+    GUEST_USER_CACHE_ATTR,
+    generate_uuid_username,
+    get_guest_model,
+    is_guest_user,
+    maybe_create_guest_user,
+)
+from guest_user.models import get_expiry  # noqa: E402
+
+SEED_BATCH_SIZE = 10000
+
+
+class Result:
+    def __init__(self, name, size, operations, seconds, queries):
+        self.name = name
+        self.size = size
+        self.operations = operations
+        self.seconds = seconds
+        self.queries = queries
+
+    def __str__(self):
+        per_second = self.operations / self.seconds if self.seconds else float("inf")
+        return (
+            f"{self.name:<32} {self.size:>9} {self.operations:>9} "
+            f"{self.seconds:>9.3f} {per_second:>12.1f} "
+            f"{self.queries / self.operations:>9.2f}"
+        )
+
+
+HEADER = (
+    f"{'benchmark':<32} {'guests':>9} {'ops':>9} "
+    f"{'seconds':>9} {'ops/s':>12} {'queries':>9}"
+)
+
+
+class QueryCounter:
+    """Count executed queries without keeping them in memory."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(name, size, operations, func, *args):
+    """Run func once per operation and count the queries."""
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        start = time.perf_counter()
+        for i in range(operations):
+            func(i, *args)
+        seconds = time.perf_counter() - start
+    return Result(name, size, operations, seconds, queries.count)
+
+
+def seed_guests(size):
+    """Fill the database with a number of guest users."""
+    UserModel = get_user_model()
+    GuestModel = get_guest_model()
+    GuestModel.objects.all().delete()
+    UserModel.objects.all().delete()
+
+    for offset in range(0, size, SEED_BATCH_SIZE):
+        count = min(SEED_BATCH_SIZE, size - offset)
+        usernames = [generate_uuid_username() for _i in range(count)]
+        UserModel.objects.bulk_create(
+            UserModel(username=username, password="!") for username in usernames
+        )
+        user_ids = UserModel.objects.filter(username__in=usernames).values_list(
+            "pk", flat=True
+        )
+        GuestModel.objects.bulk_create(
+            GuestModel(user_id=user_id, expires_at=get_expiry()) for user_id in user_ids
+        )
+
+
+def bench_create_guest_user(i):
+    get_guest_model().objects.create_guest_user()
+
+
+def bench_maybe_create_guest_user(i, factory):
+    request = factory.get("/")
+    request.session = SessionStore()
+    request.user = AnonymousUser()
+    maybe_create_guest_user(request)
+
+
+def bench_is_guest_user(i, users):
+    user = users[i % len(users)]
+    # Forget the result of the previous iteration.
+    user.__dict__.pop(GUEST_USER_CACHE_ATTR, None)
+    is_guest_user(user)
+
+
+def bench_get_user(i, backend, user_ids):
+    backend.get_user(user_ids[i % len(user_ids)])
+
+
+def bench_convert(i, users):
+    form = UserCreationForm(
+        instance=users[i],
+        data={
+            "username": f"converted{i}",
+            "password1": "s3cret-benchmark",
+            "password2": "s3cret-benchmark",
+        },
+    )
+    assert form.is_valid(), form.errors
+    get_guest_model().objects.convert(form)
+
+
+def run(size, iterations):
+    UserModel = get_user_model()
+    GuestModel = get_guest_model()
+
+    seed_guests(size)
+    regular_users = [
+        UserModel.objects.create_user(f"regular{i}") for i in range(iterations)
+    ]
+    guest_user_ids = GuestModel.objects.values_list("user_id", flat=True)[:iterations]
+    guest_users = list(UserModel.objects.filter(pk__in=list(guest_user_ids)))
+
+    yield measure("create_guest_user", size, iterations, bench_create_guest_user)
+    yield measure(
+        "maybe_create_guest_user",
+        size,
+        iterations,
+        bench_maybe_create_guest_user,
+        RequestFactory(),
+    )
+    yield measure(
+        "is_guest_user (guest)", size, iterations, bench_is_guest_user, guest_users
+    )
+    yield measure(
+        "is_guest_user (regular)",
+        size,
+        iterations,
+        bench_is_guest_user,
+        regular_users,
+    )
+    yield measure(
+        "GuestBackend.get_user",
+        size,
+        iterations,
+        bench_get_user,
+        GuestBackend(),
+        [user.pk for user in guest_users],
+    )
+    yield measure(
+        "GuestManager.convert", size, len(guest_users), bench_convert, guest_users
+    )
+
+    expired = GuestModel.objects.count()
+    GuestModel.objects.update(expires_at=now() - timedelta(days=1))
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        start = time.perf_counter()
+        deleted = GuestModel.objects.delete_expired()
+        seconds = time.perf_counter() - start
+    assert deleted == expired, (deleted, expired)
+    yield Result("GuestManager.delete_expired", size, deleted, seconds, queries.count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description=__doc__.strip().splitlines()[0]
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000",
+        help="Comma separated numbers of guests in the database.",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=1000,
+        help="Operations per benchmark.",
+    )
+    parser.add_argument(
+        "--generator",
+        default="guest_user.functions.generate_uuid_username",
+        help="Import path of the username generator to use.",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Value of GUEST_USER_NAME_CANDIDATES.",
+    )
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    old_config = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(
+            # Only measure the library, not the password hasher.
+            PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+            GUEST_USER_NAME_GENERATOR=args.generator,
+            GUEST_USER_NAME_CANDIDATES=args.candidates,
+        ):
+            print(f"Database: {connection.vendor}, generator: {args.generator}")
+            print(HEADER)
+            for size in sizes:
+                for result in run(size, args.iterations):
+                    print(result, flush=True)
+    finally:
+        connection.creation.destroy_test_db(old_config, verbosity=0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,73 @@
-from datetime import timedelta
-
 from django.contrib import admin
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.utils.timezone import now
 
-from . import settings
 from .functions import get_guest_model
 from .models import Guest
 
 
+class ExpiredListFilter(admin.SimpleListFilter):
+    title = "expired"
+    parameter_name = "expired"
+
+    def lookups(self, request, model_admin):
+        return [("1", "Yes"), ("0", "No")]
+
+    def queryset(self, request, queryset):
+        if self.value() == "1":
+            return queryset.filter(expires_at__lt=now())
+        if self.value() == "0":
+            return queryset.exclude(expires_at__lt=now())
+        return queryset
+
+
 class GuestAdmin(admin.ModelAdmin):
-    list_display = ["user", "created_at", "is_expired"]
+    list_display = ["user", "created_at", "last_seen", "expires_at", "is_expired"]
+    list_filter = [ExpiredListFilter, "pooled"]
     actions = ["delete_expired_guests"]
-    fields = ["user", "created_at"]
-    readonly_fields = ["user", "created_at", "is_expired"]
+    fields = ["user", "created_at", "last_seen", "expires_at"]
+    readonly_fields = ["user", "created_at", "last_seen", "expires_at", "is_expired"]
+
+    def get_queryset(self, request):
+        """
+        Compute the expiry of all guests in the database.
+
+        """
+        return (
+            super()
+            .get_queryset(request)
+            .select_related("user")
+            .annotate(
+                expired=ExpressionWrapper(
+                    Q(expires_at__lt=now()),
+                    output_field=BooleanField(),
+                )
+            )
+        )
 
     def is_expired(self, obj):
-        return obj.is_expired()
+        return obj.expired
 
     is_expired.boolean = True
+    # Guests without expiry never expire, sort them with the latest expiry
+    # regardless of how the database sorts NULL values.
+    is_expired.admin_order_field = F("expires_at").desc(nulls_first=True)
 
     def delete_expired_guests(self, request, queryset):
-        expired_guests = queryset.filter_expired()
-        count = expired_guests.count()
+        count = self.delete_guest_users(queryset.filter_expired())
+        self.message_user(request, f"Deleted {count} guests.")
 
-        for guest in expired_guests:
-            # Call delete method to trigger signals and cascades
-            guest.user.delete()
+    delete_expired_guests.short_description = "Delete selected expired guests"
 
-        self.message_user(request, f"Deleted {count} guests.")
+    def delete_guest_users(self, queryset):
+        """
+        Delete the users of the guests in batches.
 
-    delete_expired_guests.short_description = (
-        "Delete selected guests older than {}".format(
-            timedelta(seconds=settings.MAX_AGE)
-        )
-    )
+        """
+        count = 0
+        for user_ids in queryset.user_id_batches():
+            count += self.model.objects.delete_users(user_ids)
+        return count
 
     def has_add_permission(self, request):
         return False
@@ -63,8 +98,7 @@ class GuestAdmin(admin.ModelAdmin):
         Make the delete action cascade.
 
         """
-        for obj in queryset:
-            obj.user.delete()
+        self.delete_guest_users(queryset)
 
 
 if get_guest_model() == Guest:
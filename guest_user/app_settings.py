@@ -1,5 +1,5 @@
 import re
-from typing import List
+from typing import List, Optional, Tuple
 
 
 class AppSettings:
@@ -13,12 +13,22 @@ class AppSettings:
 
     def __init__(self, prefix):
         self.prefix = prefix
+        self._cache = {}
 
     def get(self, name, default):
         from django.conf import settings
 
         return getattr(settings, self.prefix + name, default)
 
+    def clear_cache(self):
+        """
+        Forget values that were computed from settings.
+
+        Called when a ``GUEST_USER_`` setting changes, e.g. in tests.
+
+        """
+        self._cache.clear()
+
     @property
     def NAME_GENERATOR(self) -> str:
         """
@@ -45,6 +55,8 @@ class AppSettings:
 
         If the generator creates a username that already exists, a new one will
         be tried until a unique username has been found.
+        See :attr:`GUEST_USER_NAME_CANDIDATES<guest_user.app_settings.AppSettings.NAME_CANDIDATES>`
+        to reduce the number of retries for generators with a small number of names.
 
         """
         return self.get("NAME_GENERATOR", "guest_user.functions.generate_uuid_username")
@@ -69,12 +81,33 @@ class AppSettings:
         """
         return self.get("NAME_SUFFIX_DIGITS", 4)
 
+    @property
+    def NAME_CANDIDATES(self) -> int:
+        """
+        Number of usernames to generate at once for a new guest user.
+
+        With more than one candidate, all of them are checked for existing users
+        with a single query and the first free username is used.
+        This avoids a failed insert and rollback for each taken username, which
+        is useful for generators that produce collisions frequently,
+        such as ``generate_numbered_username`` with few digits.
+
+        With the default of a single candidate, the generated username is
+        inserted right away and only replaced should it already exist.
+
+        :default: ``1``
+
+        """
+        return self.get("NAME_CANDIDATES", 1)
+
     @property
     def MAX_AGE(self) -> int:
         """
         Maximum age in seconds for guest sessions to stay valid.
 
         After this time the session may get deleted by background tasks.
+        The expiry time is stored with each guest when it is created,
+        changing this setting does not affect existing guests.
 
         :default: :ref:`django:ref/settings:``session_cookie_age```
 
@@ -86,6 +119,64 @@ class AppSettings:
             max_age = django_settings.SESSION_COOKIE_AGE
         return max_age
 
+    @property
+    def EXPIRE_INACTIVE(self) -> bool:
+        """
+        Measure the age of guests from their last activity instead of their creation.
+
+        Guests that keep using the site are kept around, while idle guests
+        expire :attr:`GUEST_USER_MAX_AGE<guest_user.app_settings.AppSettings.MAX_AGE>`
+        seconds after their last visit.
+        The expiry time of a guest is extended whenever their activity is recorded.
+        Activity is recorded by the
+        :class:`GuestActivityMiddleware<guest_user.middleware.GuestActivityMiddleware>`.
+
+        :default: ``False``
+
+        """
+        return self.get("EXPIRE_INACTIVE", False)
+
+    @property
+    def ACTIVITY_UPDATE_INTERVAL(self) -> int:
+        """
+        Minimum number of seconds between two updates of a guest's last activity.
+
+        The last activity is written to the database at most once per interval,
+        so it may lag behind by up to this many seconds.
+
+        :default: ``300``
+
+        """
+        return self.get("ACTIVITY_UPDATE_INTERVAL", 300)
+
+    @property
+    def CLEANUP_BATCH_SIZE(self) -> int:
+        """
+        Number of expired guest users deleted at once by cleanup jobs.
+
+        Each batch is deleted with a single cascading delete,
+        larger batches need more memory but fewer queries.
+
+        :default: ``1000``
+
+        """
+        return self.get("CLEANUP_BATCH_SIZE", 1000)
+
+    @property
+    def CLEANUP_CURSOR_CACHE(self) -> str:
+        """
+        The cache used to remember where a cleanup job stopped early.
+
+        Used by the ``delete_expired_users`` command when it is stopped by
+        ``--max-runtime`` or ``--max-rows``, so the next run continues
+        where the last one stopped. The cache must be shared between processes,
+        local memory and dummy caches are rejected.
+
+        :default: ``"default"``
+
+        """
+        return self.get("CLEANUP_CURSOR_CACHE", "default")
+
     @property
     def CONVERT_FORM(self) -> str:
         """
@@ -99,6 +190,20 @@ class AppSettings:
         """
         return self.get("CONVERT_FORM", "guest_user.forms.UserCreationForm")
 
+    @property
+    def CONVERT_LOGIN_BACKEND(self) -> Optional[str]:
+        """
+        Import path of the authentication backend to log in converted users with.
+
+        The backend must be listed in ``AUTHENTICATION_BACKENDS``. If not set,
+        Django's ``ModelBackend`` is used when it is listed. Otherwise the user is
+        authenticated with the credentials of the conversion form.
+
+        :default: ``None``
+
+        """
+        return self.get("CONVERT_LOGIN_BACKEND", None)
+
     @property
     def CONVERT_PREFILL_USERNAME(self) -> bool:
         """
@@ -171,11 +276,15 @@ class AppSettings:
         A list of ignored user agents that will not create guest users.
 
         Items will be compiled together as a regular expression so you may use regex syntax.
+        The expression is compiled once and reused for every request.
 
         :default: Googlebot, Mediapartners-Google, Bingbot, Slurp, DuckDuckBot,
                   Baiduspider, Yandex(Mobile)?Bot, Sogou, Exabot, facebot, facebookexternalhit, ia_archiver
 
         """
+        if "BLOCKED_USER_AGENTS" in self._cache:
+            return self._cache["BLOCKED_USER_AGENTS"]
+
         blocked_uas = self.get(
             "BLOCKED_USER_AGENTS",
             [
@@ -195,7 +304,108 @@ class AppSettings:
         )
 
         expression = f"({ ')|('.join(blocked_uas) })"
-        return re.compile(expression, re.IGNORECASE)
+        pattern = self._cache["BLOCKED_USER_AGENTS"] = re.compile(
+            expression, re.IGNORECASE
+        )
+        return pattern
+
+    @property
+    def RATE_LIMIT(self) -> Optional[Tuple[int, int]]:
+        """
+        Limit how many guest users a single client may create.
+
+        A tuple of the number of guest users and a period in seconds,
+        e.g. ``(20, 3600)`` to allow 20 new guest users per client and hour.
+        Clients over the limit will be served as anonymous visitors.
+
+        :default: ``None`` (no limit)
+
+        """
+        return self.get("RATE_LIMIT", None)
+
+    @property
+    def RATE_LIMIT_KEY(self) -> str:
+        """
+        Import path to a function that identifies the client of a request.
+
+        The function receives the request and returns a short string
+        used as a cache key, or ``None`` to not limit the request.
+
+        :default: :func:`guest_user.functions.get_client_network`
+
+        """
+        return self.get("RATE_LIMIT_KEY", "guest_user.functions.get_client_network")
+
+    @property
+    def RATE_LIMIT_CACHE(self) -> str:
+        """
+        The cache used to count the guest users created by each client.
+
+        Use a cache that is shared between all processes, such as Redis or Memcached.
+        Local-memory caches work too, but count for each process on its own.
+
+        :default: ``"default"``
+
+        """
+        return self.get("RATE_LIMIT_CACHE", "default")
+
+    @property
+    def STATUS_CACHE(self) -> Optional[str]:
+        """
+        The cache used to remember which users are guests.
+
+        Guest checks of users that are not already known to be guests from their
+        session are answered from this cache instead of the database. It is updated
+        whenever guests are created, converted or deleted.
+        Use a cache that is shared between all processes, such as Redis or Memcached.
+
+        :default: ``None`` (always check the database)
+
+        """
+        return self.get("STATUS_CACHE", None)
+
+    @property
+    def MIDDLEWARE_INCLUDE_PATHS(self) -> Optional[List[str]]:
+        """
+        Paths where the :class:`GuestUserMiddleware<guest_user.middleware.GuestUserMiddleware>`
+        creates guest users.
+
+        Each item is a regular expression matched against the beginning of the path,
+        for example ``[r"/app/", r"/shop/cart/$"]``.
+        All paths are included if this setting is ``None``.
+
+        :default: ``None``
+
+        """
+        return self.get("MIDDLEWARE_INCLUDE_PATHS", None)
+
+    @property
+    def MIDDLEWARE_EXCLUDE_PATHS(self) -> List[str]:
+        """
+        Paths where the :class:`GuestUserMiddleware<guest_user.middleware.GuestUserMiddleware>`
+        never creates guest users, even if they are included.
+
+        Each item is a regular expression matched against the beginning of the path,
+        for example ``[r"/static/", r"/api/", r"/healthz$"]``.
+
+        :default: ``[]``
+
+        """
+        return self.get("MIDDLEWARE_EXCLUDE_PATHS", [])
+
+    @property
+    def METRICS_EXPORTERS(self) -> List[str]:
+        """
+        Import paths of :class:`MetricsExporter<guest_user.metrics.MetricsExporter>`
+        classes that receive all metric updates.
+
+        The metrics are always recorded in the in-process
+        :data:`registry<guest_user.metrics.registry>` as well.
+
+        :default: ``[]``
+
+        """
+        return self.get("METRICS_EXPORTERS", [])
 
     @property
     def ENABLED(self) -> bool:
@@ -212,6 +422,59 @@ class AppSettings:
         """
         return self.get("ENABLED", True)
 
+    @property
+    def LAZY(self) -> bool:
+        """
+        Defer creating guest users until they are actually used.
+
+        Instead of creating a guest user before the view is called,
+        ``request.user`` will be a placeholder that is authenticated and a guest.
+        The guest user is only created and logged in once the view accesses
+        any other attribute, such as the primary key, or assigns the user to
+        a model field. Visitors that only read a page will not cause any writes.
+
+        Can be overridden per view with the ``lazy`` argument of
+        :func:`@allow_guest_user<guest_user.decorators.allow_guest_user>` or the
+        :attr:`lazy<guest_user.mixins.AllowGuestUserMixin.lazy>` attribute.
+
+        :default: ``False``
+
+        """
+        return self.get("LAZY", False)
+
+    @property
+    def SESSION_ONLY(self) -> bool:
+        """
+        Keep guest users in the session instead of the database.
+
+        Guests are represented by a :class:`GuestUser<guest_user.functions.GuestUser>`
+        and only saved to the database when they convert or when
+        :func:`persist_guest_user<guest_user.functions.persist_guest_user>` is called.
+        Requires the :class:`GuestUserMiddleware<guest_user.middleware.GuestUserMiddleware>`
+        to restore guests on every request.
+
+        :default: ``False``
+
+        """
+        return self.get("SESSION_ONLY", False)
+
+    @property
+    def USE_POOL(self) -> bool:
+        """
+        Claim new guest users from a pool of guests created in advance.
+
+        The pool is filled with the ``create_guest_pool`` management command.
+        If the pool is empty, guest users are created as usual.
+
+        Pooled users are inserted in bulk without the ``create_user()`` method of
+        the user manager, and their ``date_joined`` is the time the pool was filled.
+        ``post_save`` is sent for every created user.
+
+        :default: ``False``
+
+        """
+        return self.get("USE_POOL", False)
+
     @property
     def MODEL(self) -> str:
         """
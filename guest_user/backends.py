@@ -1,10 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 
-from .functions import is_guest_user
+from .functions import is_guest_user, with_guest_status
 
 
 class GuestBackend(ModelBackend):
+    def get_user_queryset(self):
+        """
+        Return the users with their guest status already resolved.
+
+        The guest status is annotated as the cached value used by
+        :func:`is_guest_user<guest_user.functions.is_guest_user>`,
+        so no further queries are needed during the request.
+
+        """
+        UserModel = get_user_model()
+        return with_guest_status(UserModel._default_manager.all())
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         """Authenticate with username only."""
 
@@ -16,7 +28,7 @@ class GuestBackend(ModelBackend):
         UserModel = get_user_model()
 
         try:
-            user = UserModel.objects.get(**{UserModel.USERNAME_FIELD: username})
+            user = self.get_user_queryset().get(**{UserModel.USERNAME_FIELD: username})
         except UserModel.DoesNotExist:
             return None
         if is_guest_user(user):
@@ -26,7 +38,7 @@ class GuestBackend(ModelBackend):
     def get_user(self, user_id):
         UserModel = get_user_model()
         try:
-            user = UserModel._default_manager.get(pk=user_id)
+            user = self.get_user_queryset().get(pk=user_id)
         except UserModel.DoesNotExist:
             return None
         return user
@@ -35,4 +35,17 @@ def check_settings(app_configs, **kwargs):
             )
         )
 
+    middleware = "guest_user.middleware.GuestUserMiddleware"
+
+    if settings.SESSION_ONLY and middleware not in django_settings.MIDDLEWARE:
+        checks.append(
+            Warning(
+                "GUEST_USER_SESSION_ONLY is enabled without the GuestUserMiddleware. "
+                "Guests will only be recognized in views that allow guest users.",
+                hint='Add "guest_user.middleware.GuestUserMiddleware" to the MIDDLEWARE setting.',
+                obj="settings",
+                id="guest_user.W002",
+            )
+        )
+
     return checks
@@ -3,7 +3,13 @@ from django.dispatch import Signal, receiver
 
 from allauth.socialaccount.signals import social_account_added
 
-from ...functions import get_guest_model, is_guest_user
+from ...functions import (
+    get_guest_model,
+    is_guest_user,
+    set_guest_status,
+    set_guest_user_cache,
+)
+from ...metrics import registry
 
 
 @receiver(social_account_added)
@@ -22,6 +28,9 @@ def convert_guest_with_social_login(sender, request, sociallogin, **kwargs):
         # Convert the user right away, since the social account
         # has already been connected at this point.
         get_guest_model().objects.filter(user=user).delete()
+        set_guest_user_cache(user, False)
+        set_guest_status([user.pk], False)
+        registry.increment("guests_converted")
 
         from allauth.account.adapter import get_adapter as get_account_adapter
         from allauth.socialaccount.adapter import get_adapter as get_social_adapter
@@ -5,13 +5,34 @@ from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.shortcuts import redirect
 
 from . import settings
-from .functions import is_guest_user, maybe_create_guest_user, redirect_with_next
-
-
-def allow_guest_user(function=None):
+from .functions import (
+    aget_request_user,
+    ais_guest_user,
+    amaybe_create_guest_user,
+    has_session_cookie,
+    is_guest_user,
+    maybe_create_guest_user,
+    redirect_with_next,
+    set_anonymous_user,
+)
+
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+
+def allow_guest_user(function=None, lazy=None, beacon=False):
     """
     Allow anonymous users to access the view by creating a guest user.
 
+    :param lazy: Only create the guest user once the view uses it.
+      Defaults to :attr:`GUEST_USER_LAZY<guest_user.app_settings.AppSettings.LAZY>`.
+    :param beacon: Serve visitors without a session anonymously.
+      Their guest user is created by the
+      :func:`guest_user_beacon<guest_user.templatetags.guest_user.guest_user_beacon>`
+      on the rendered page instead, so the response can be cached.
+
     Usage example::
 
         from guest_user.decorators import allow_guest_user
@@ -23,9 +44,24 @@ def allow_guest_user(function=None):
     """
 
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not beacon or has_session_cookie(request):
+                    await amaybe_create_guest_user(request, lazy=lazy)
+                else:
+                    set_anonymous_user(request)
+                return await view_func(request, *args, **kwargs)
+
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            maybe_create_guest_user(request)
+            if not beacon or has_session_cookie(request):
+                maybe_create_guest_user(request, lazy=lazy)
+            else:
+                set_anonymous_user(request)
             return view_func(request, *args, **kwargs)
 
         return wrapper
@@ -62,16 +98,28 @@ def guest_user_required(
 
     """
 
+    def get_redirect_url(user):
+        if user.is_anonymous:
+            return anonymous_url or settings.REQUIRED_ANON_URL
+        return registered_url or settings.REQUIRED_USER_URL
+
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                user = await aget_request_user(request)
+                if await ais_guest_user(user):
+                    return await view_func(request, *args, **kwargs)
+                return redirect(get_redirect_url(user))
+
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if is_guest_user(request.user):
                 return view_func(request, *args, **kwargs)
-            if request.user.is_anonymous:
-                redirect_url = anonymous_url or settings.REQUIRED_ANON_URL
-            else:
-                redirect_url = registered_url or settings.REQUIRED_USER_URL
-            return redirect(redirect_url)
+            return redirect(get_redirect_url(request.user))
 
         return wrapper
 
@@ -113,17 +161,31 @@ def regular_user_required(
 
     """
 
+    def redirect_user(request, user):
+        if user.is_anonymous:
+            redirect_url = login_url or django_settings.LOGIN_URL
+        else:
+            redirect_url = convert_url or settings.CONVERT_URL
+        return redirect_with_next(request, redirect_url, redirect_field_name)
+
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                user = await aget_request_user(request)
+                if user.is_authenticated and not await ais_guest_user(user):
+                    return await view_func(request, *args, **kwargs)
+                return redirect_user(request, user)
+
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             user = request.user
             if user.is_authenticated and not is_guest_user(user):
                 return view_func(request, *args, **kwargs)
-            if user.is_anonymous:
-                redirect_url = login_url or django_settings.LOGIN_URL
-            else:
-                redirect_url = convert_url or settings.CONVERT_URL
-            return redirect_with_next(request, redirect_url, redirect_field_name)
+            return redirect_user(request, user)
 
         return wrapper
 
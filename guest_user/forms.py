@@ -9,6 +9,16 @@ class UserCreationForm(BaseUserCreationForm):
 
     """
 
+    authenticate_on_convert = False
+    """
+    Authenticate the converted user with their credentials before logging them in.
+
+    The user is logged in right away by default, which skips
+    hashing the new password a second time.
+    Set to ``True`` if your authentication backends need to verify the user.
+
+    """
+
     def get_credentials(self) -> dict:
         """
         Get the credentials required to log the user in after conversion.
@@ -1,42 +1,530 @@
+import ipaddress
 import random
+import time
 import uuid
+from datetime import timedelta
+from functools import lru_cache
+from typing import List, Optional
 from urllib.parse import urlparse
 
+from asgiref.sync import sync_to_async
 from django.apps import apps as django_apps
-from django.contrib.auth import authenticate, get_user_model, login
+from django.conf import settings as django_settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY, get_user_model, login
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db.models import Exists, OuterRef, QuerySet
+from django.dispatch import receiver
 from django.shortcuts import resolve_url
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
 
 from . import settings
+from .metrics import registry
 
+USER_AGENT_CACHE_SIZE = 1024
+"""Number of recently seen user agents whose block verdict is remembered."""
 
-def maybe_create_guest_user(request):
+GUEST_BACKEND = "guest_user.backends.GuestBackend"
+"""Import path of the authentication backend for guest users."""
+
+GUEST_USER_CACHE_ATTR = "_is_guest_user"
+"""Attribute on user instances holding their cached guest status."""
+
+LAST_SEEN_SESSION_KEY = "_guest_user_last_seen"
+"""Session key holding the time of the last activity update."""
+
+SESSION_GUEST_KEY = "_guest_user"
+"""Session key holding a session-only guest user."""
+
+
+def maybe_create_guest_user(request, lazy: bool = None):
     """
     Create a guest user and log them in.
 
     This function will create and authenticate a new guest user should the visitor
     not be authenticated already and their user agent isn't on the block list.
 
+    :param lazy: Defer creating the guest user until the user object is used.
+      Defaults to :attr:`GUEST_USER_LAZY<guest_user.app_settings.AppSettings.LAZY>`.
+
     """
     assert hasattr(
         request, "session"
     ), "Please add 'django.contrib.sessions' to INSTALLED_APPS."
 
     if settings.ENABLED and request.user.is_anonymous:
+        if settings.SESSION_ONLY:
+            session_guest = get_session_guest_user(request)
+            if session_guest is not None:
+                request.user = session_guest
+                return
+
+        if lazy is None:
+            lazy = settings.LAZY
+        # Lazy guests are counted towards the rate limit once they are created.
+        lazy = lazy and not settings.SESSION_ONLY
+
         user_agent = request.META.get("HTTP_USER_AGENT", "")
-        if not settings.BLOCKED_USER_AGENTS.search(user_agent):
-            UserModel = get_user_model()
-            Guest = get_guest_model()
-            user = Guest.objects.create_guest_user(request)
-            user = authenticate(
-                request=request,
-                username=getattr(user, UserModel.USERNAME_FIELD),
-            )
-            assert user, (
-                "Guest authentication failed. Do you have "
-                "'guest_user.backends.GuestBackend' in AUTHENTICATION_BACKENDS?"
-            )
-            login(request, user)
+        if is_blocked_user_agent(user_agent):
+            registry.increment("guests_blocked_user_agent")
+        elif is_rate_limited(request, increment=not lazy):
+            registry.increment("guests_rate_limited")
+        elif settings.SESSION_ONLY:
+            request.user = create_session_guest_user(request)
+        elif lazy:
+            request.user = LazyGuestUser(lambda: login_lazy_guest_user(request))
+        else:
+            login_new_guest_user(request)
+
+
+def has_session_cookie(request) -> bool:
+    """
+    Check if the client has sent a session cookie.
+
+    :meta private:
+
+    """
+    return django_settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def set_anonymous_user(request):
+    """
+    Serve the request anonymously without accessing the session.
+
+    Reading the user from the session would add ``Vary: Cookie``
+    to the response, which prevents caching it.
+
+    :meta private:
+
+    """
+    user = AnonymousUser()
+
+    async def auser():
+        return user
+
+    request.user = user
+    request.auser = auser
+
+
+def login_new_guest_user(request, username: str = None):
+    """
+    Create a new guest user and log them in unconditionally.
+
+    :meta private:
+
+    """
+    assert GUEST_BACKEND in django_settings.AUTHENTICATION_BACKENDS, (
+        "Guest authentication failed. Do you have "
+        "'guest_user.backends.GuestBackend' in AUTHENTICATION_BACKENDS?"
+    )
+    Guest = get_guest_model()
+    return Guest.objects.create_guest_user(request, username=username, login=True)
+
+
+def login_guest_user(request, user) -> str:
+    """
+    Log in a guest user that was just created.
+
+    Returns the key of the new session, if the session engine has one yet.
+
+    :meta private:
+
+    """
+    # The user was just created, there is no need to authenticate them.
+    login(request, user, backend=GUEST_BACKEND)
+    # The guest was active just now, see track_guest_activity().
+    request.session[LAST_SEEN_SESSION_KEY] = int(time.time())
+    return request.session.session_key or ""
+
+
+def login_lazy_guest_user(request):
+    """
+    Create the guest user of a :class:`LazyGuestUser` once it is used.
+
+    The view may already have rendered a CSRF token at that point, so the
+    CSRF secret is kept instead of rotated by the login. A brand-new guest
+    has no privileges that a fixated token could be used against.
+
+    :meta private:
+
+    """
+    # Count the client towards the rate limit now that a guest is created.
+    is_rate_limited(request)
+    csrf_secret = request.META.get("CSRF_COOKIE")
+    user = login_new_guest_user(request)
+    if csrf_secret is not None:
+        request.META["CSRF_COOKIE"] = csrf_secret
+    return user
+
+
+async def amaybe_create_guest_user(request, lazy: bool = None):
+    """
+    Async version of :func:`maybe_create_guest_user`.
+
+    Lazy guests are not supported in async views, since their creation
+    would happen synchronously. The guest user is created right away instead.
+
+    """
+    assert hasattr(
+        request, "session"
+    ), "Please add 'django.contrib.sessions' to INSTALLED_APPS."
+
+    if not settings.ENABLED:
+        return
+
+    user = await aget_request_user(request)
+    if user.is_anonymous:
+        if settings.SESSION_ONLY:
+            # Sessions can only be loaded synchronously.
+            await sync_to_async(maybe_create_guest_user)(request)
+            return
+
+        user_agent = request.META.get("HTTP_USER_AGENT", "")
+        if is_blocked_user_agent(user_agent):
+            registry.increment("guests_blocked_user_agent")
+        elif settings.RATE_LIMIT and await sync_to_async(is_rate_limited)(request):
+            registry.increment("guests_rate_limited")
+        else:
+            await alogin_new_guest_user(request)
+
+
+async def alogin_new_guest_user(request):
+    """
+    Async version of :func:`login_new_guest_user`.
+
+    :meta private:
+
+    """
+    assert GUEST_BACKEND in django_settings.AUTHENTICATION_BACKENDS, (
+        "Guest authentication failed. Do you have "
+        "'guest_user.backends.GuestBackend' in AUTHENTICATION_BACKENDS?"
+    )
+    Guest = get_guest_model()
+    return await Guest.objects.acreate_guest_user(request, login=True)
+
+
+async def aget_request_user(request):
+    """
+    Return the user of the request without blocking the event loop.
+
+    The loaded user replaces the lazy ``request.user``,
+    so the view can use it without further queries.
+
+    :meta private:
+
+    """
+    if hasattr(request, "auser"):
+        request.user = await request.auser()
+    else:
+        # Evaluate the lazy user object in a thread, Django < 5.0.
+        await sync_to_async(lambda: request.user.is_anonymous)()
+    return request.user
+
+
+class LazyGuestUser(SimpleLazyObject):
+    """
+    A guest user that is only created once it is actually used.
+
+    It reports being an authenticated guest without touching the database.
+    Accessing any other attribute, such as the primary key, or assigning it
+    to a model field will create the guest user and log them in.
+
+    """
+
+    is_anonymous = False
+    is_authenticated = True
+    _is_guest_user = True  # see GUEST_USER_CACHE_ATTR
+
+
+class GuestUser(AnonymousUser):
+    """
+    A guest user that only exists in the session.
+
+    Used instead of a database user if
+    :attr:`GUEST_USER_SESSION_ONLY<guest_user.app_settings.AppSettings.SESSION_ONLY>`
+    is enabled. It is authenticated and treated as a guest, but it has no
+    primary key and no permissions. Use :func:`persist_guest_user` to turn it into
+    a regular guest user once a database row is needed.
+
+    """
+
+    is_active = True
+    _is_guest_user = True  # see GUEST_USER_CACHE_ATTR
+
+    def __init__(self, username: str, created_at: int):
+        self.username = username
+        self.created_at = created_at
+
+    def __str__(self):
+        return self.username
+
+    def __eq__(self, other):
+        return isinstance(other, GuestUser) and other.username == self.username
+
+    def __hash__(self):
+        return hash(self.username)
+
+    def __getattr__(self, name):
+        # Allow reading the username with a custom USERNAME_FIELD.
+        if name == get_user_model().USERNAME_FIELD:
+            return self.username
+        raise AttributeError(name)
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    def get_username(self):
+        return self.username
+
+    def get_all_permissions(self, obj=None):
+        return set()
+
+    def has_perm(self, perm, obj=None):
+        return False
+
+    def has_module_perms(self, module):
+        return False
+
+    def to_session(self) -> dict:
+        """:meta private:"""
+        return {"username": self.username, "created_at": self.created_at}
+
+    def to_user(self):
+        """
+        Return an unsaved user instance for this guest, e.g. for a ModelForm.
+
+        """
+        UserModel = get_user_model()
+        user = UserModel(**{UserModel.USERNAME_FIELD: self.username})
+        user.set_unusable_password()
+        set_guest_user_cache(user, True)
+        return user
+
+
+def create_session_guest_user(request) -> GuestUser:
+    """
+    Create a new guest user in the session.
+
+    :meta private:
+
+    """
+    Guest = get_guest_model()
+    user = GuestUser(Guest.objects.generate_username(), int(time.time()))
+    request.session[SESSION_GUEST_KEY] = user.to_session()
+    registry.increment("session_guests_created")
+    return user
+
+
+def get_session_guest_user(request) -> Optional[GuestUser]:
+    """
+    Return the session-only guest user of the request, if there is one.
+
+    """
+    data = request.session.get(SESSION_GUEST_KEY)
+    if data is None:
+        return None
+    return GuestUser(**data)
+
+
+def restore_session_guest_user(request):
+    """
+    Replace an anonymous ``request.user`` with the guest stored in the session.
+
+    The session is only read once the user is accessed.
+
+    :meta private:
+
+    """
+    user = request.user
+
+    def get_user():
+        if user.is_anonymous:
+            return get_session_guest_user(request) or user
+        return user
+
+    request.user = SimpleLazyObject(get_user)
+
+    auser = getattr(request, "auser", None)
+    if auser is not None:
+
+        async def get_auser():
+            user = await auser()
+            if user.is_anonymous:
+                return await sync_to_async(get_session_guest_user)(request) or user
+            return user
+
+        request.auser = get_auser
+
+
+def persist_guest_user(request):
+    """
+    Save a session-only guest user to the database and log them in.
+
+    Returns the new user, or the current user if it is not a session-only guest.
+
+    """
+    user = request.user
+    if not isinstance(user, GuestUser):
+        return user
+
+    user = login_new_guest_user(request, username=user.username)
+    request.session.pop(SESSION_GUEST_KEY, None)
+    registry.increment("session_guests_persisted")
+    return user
+
+
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def is_blocked_user_agent(user_agent: str) -> bool:
+    """
+    Check if the user agent is on the block list.
+
+    Verdicts for recently seen user agents are cached, as crawlers tend
+    to send the same few strings over and over again.
+
+    """
+    return settings.BLOCKED_USER_AGENTS.search(user_agent) is not None
+
+
+def is_rate_limited(request, increment: bool = True) -> bool:
+    """
+    Check if the client has created too many guest users recently.
+
+    Every call counts as a new guest user for the client, unless ``increment``
+    is false. Lazy guests are only checked up front and counted once created.
+    The counters are kept in the cache configured with
+    :attr:`GUEST_USER_RATE_LIMIT_CACHE<guest_user.app_settings.AppSettings.RATE_LIMIT_CACHE>`.
+
+    """
+    if not settings.RATE_LIMIT:
+        return False
+
+    client = import_string(settings.RATE_LIMIT_KEY)(request)
+    if client is None:
+        return False
+
+    limit, period = settings.RATE_LIMIT
+    window = int(time.time() // period)
+    key = f"guest_user:rate_limit:{client}:{window}"
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    if not increment:
+        return cache.get(key, 0) >= limit
+
+    # add() and incr() are atomic with shared cache backends.
+    cache.add(key, 0, timeout=period)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # The counter expired in the meantime.
+        count = 1
+        cache.set(key, count, timeout=period)
+    return count > limit
+
+
+def track_guest_activity(request):
+    """
+    Record the activity of a guest user.
+
+    The ``last_seen`` time of the guest is updated at most once per
+    :attr:`GUEST_USER_ACTIVITY_UPDATE_INTERVAL<guest_user.app_settings.AppSettings.ACTIVITY_UPDATE_INTERVAL>`.
+    The time of the last update is kept in the session, so requests in between
+    don't need any queries at all.
+
+    """
+    session = request.session
+    # Reading the session of visitors without one would add Vary: Cookie.
+    if not session.session_key or session.get(BACKEND_SESSION_KEY) != GUEST_BACKEND:
+        return
+
+    timestamp = int(time.time())
+    last_update = session.get(LAST_SEEN_SESSION_KEY)
+    if (
+        last_update is not None
+        and timestamp - last_update < settings.ACTIVITY_UPDATE_INTERVAL
+    ):
+        return
+
+    last_seen = now()
+    values = {"last_seen": last_seen}
+    if settings.EXPIRE_INACTIVE:
+        values["expires_at"] = last_seen + timedelta(seconds=settings.MAX_AGE)
+    if session.session_key:
+        # The key may have been rotated since the guest logged in.
+        values["session_key"] = session.session_key
+
+    Guest = get_guest_model()
+    Guest.objects.filter(user_id=session[SESSION_KEY]).update(**values)
+    session[LAST_SEEN_SESSION_KEY] = timestamp
+
+
+def delete_sessions(session_keys: List[str]):
+    """
+    Delete sessions in bulk.
+
+    Supports the database and cache session engines, including ``cached_db``.
+    Sessions stored elsewhere are left for the ``clearsessions`` command.
+
+    :meta private:
+
+    """
+    session_keys = [key for key in session_keys if key]
+    if not session_keys:
+        return
+
+    SessionStore = import_string(f"{django_settings.SESSION_ENGINE}.SessionStore")
+    if hasattr(SessionStore, "cache_key_prefix"):
+        caches[django_settings.SESSION_CACHE_ALIAS].delete_many(
+            [SessionStore.cache_key_prefix + key for key in session_keys]
+        )
+    if issubclass(SessionStore, DBSessionStore):
+        SessionStore.get_model_class()._default_manager.filter(
+            session_key__in=session_keys
+        ).delete()
+
+
+def get_client_network(request) -> Optional[str]:
+    """
+    Identify the client of a request for rate limiting.
+
+    Uses the IP address for IPv4 clients and the /64 network for IPv6 clients,
+    since a single IPv6 client usually has a whole network at its disposal.
+
+    If your site is behind a proxy, ``REMOTE_ADDR`` will be the proxy's address.
+    Use a custom function with
+    :attr:`GUEST_USER_RATE_LIMIT_KEY<guest_user.app_settings.AppSettings.RATE_LIMIT_KEY>`
+    to read the client address from a trusted header instead.
+
+    """
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return None
+    if address.version == 6:
+        return str(ipaddress.ip_network(f"{address}/64", strict=False))
+    return str(address)
+
+
+@receiver(setting_changed)
+def clear_settings_cache(setting, **kwargs):
+    """
+    Drop cached values when a guest user setting changes.
+
+    :meta private:
+
+    """
+    if setting.startswith(settings.prefix):
+        settings.clear_cache()
+        is_blocked_user_agent.cache_clear()
+        registry.clear_exporters()
 
 
 def get_guest_model():
@@ -60,16 +548,138 @@ def is_guest_user(user) -> bool:
     """
     Check if the given user instance is a temporary guest.
 
+    The result is cached on the user instance, so repeated checks
+    during the same request will only query the database once.
+
     """
 
     if user.is_anonymous:
         return False
 
-    if getattr(user, "backend", None) == "guest_user.backends.GuestBackend":
-        return True
+    is_guest = getattr(user, GUEST_USER_CACHE_ATTR, None)
+    if is_guest is not None:
+        return is_guest
+
+    if getattr(user, "backend", None) == GUEST_BACKEND:
+        is_guest = True
+    else:
+        cache = get_status_cache()
+        if cache is not None:
+            is_guest = cache.get(get_status_cache_key(user.pk))
+        if is_guest is None:
+            GuestModel = get_guest_model()
+            is_guest = GuestModel.objects.filter(user=user).exists()
+            if cache is not None:
+                cache.set(get_status_cache_key(user.pk), is_guest)
+
+    set_guest_user_cache(user, is_guest)
+    return is_guest
+
+
+async def ais_guest_user(user) -> bool:
+    """
+    Async version of :func:`is_guest_user`.
+
+    """
+    if user.is_anonymous:
+        return False
+
+    is_guest = getattr(user, GUEST_USER_CACHE_ATTR, None)
+    if is_guest is not None:
+        return is_guest
+
+    if not hasattr(QuerySet, "aexists"):  # Django < 4.1
+        return await sync_to_async(is_guest_user)(user)
+
+    if getattr(user, "backend", None) == GUEST_BACKEND:
+        is_guest = True
+    else:
+        cache = get_status_cache()
+        if cache is not None:
+            is_guest = await cache.aget(get_status_cache_key(user.pk))
+        if is_guest is None:
+            GuestModel = get_guest_model()
+            is_guest = await GuestModel.objects.filter(user=user).aexists()
+            if cache is not None:
+                await cache.aset(get_status_cache_key(user.pk), is_guest)
+
+    set_guest_user_cache(user, is_guest)
+    return is_guest
+
+
+def with_guest_status(queryset):
+    """
+    Annotate the guest status of users in the same query.
+
+    :func:`is_guest_user` and the
+    :func:`is_guest_user<guest_user.templatetags.guest_user.is_guest_user>` template filter
+    use the annotation, so listing many users won't query the guest status of each one.
 
+    .. code:: python
+
+        users = with_guest_status(User.objects.order_by("-date_joined"))
+
+    :param queryset: A queryset of the user model.
+
+    """
     GuestModel = get_guest_model()
-    return GuestModel.objects.filter(user=user).exists()
+    return queryset.annotate(
+        **{
+            GUEST_USER_CACHE_ATTR: Exists(
+                GuestModel.objects.filter(user=OuterRef("pk"))
+            )
+        }
+    )
+
+
+def set_guest_user_cache(user, is_guest: bool):
+    """
+    Update the cached guest status of a user instance.
+
+    Must be called whenever a user instance is turned into a guest
+    or converted to a regular user.
+
+    :meta private:
+
+    """
+    setattr(user, GUEST_USER_CACHE_ATTR, is_guest)
+
+
+def get_status_cache():
+    """
+    Return the cache for guest statuses, if one is configured.
+
+    :meta private:
+
+    """
+    if settings.STATUS_CACHE is None:
+        return None
+    return caches[settings.STATUS_CACHE]
+
+
+def get_status_cache_key(user_id) -> str:
+    """:meta private:"""
+    return f"guest_user:is_guest:{user_id}"
+
+
+def set_guest_status(user_ids, is_guest: Optional[bool]):
+    """
+    Update the cached guest status of users.
+
+    Must be called whenever users become guests, are converted
+    to regular users or deleted. Pass ``None`` to forget the status.
+
+    :meta private:
+
+    """
+    cache = get_status_cache()
+    if cache is None:
+        return
+    keys = [get_status_cache_key(user_id) for user_id in user_ids]
+    if is_guest is None:
+        cache.delete_many(keys)
+    else:
+        cache.set_many(dict.fromkeys(keys, is_guest))
 
 
 def generate_uuid_username() -> str:
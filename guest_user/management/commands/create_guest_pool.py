@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...functions import get_guest_model
+
+
+class Command(BaseCommand):
+    help = "Fill the pool of unclaimed guest users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "size",
+            type=int,
+            help="Number of unclaimed guest users the pool should contain.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of guest users to create at once.",
+        )
+
+    def handle(self, size, batch_size=None, **options):
+        """Create guests until the pool has the requested size"""
+        if size < 0:
+            raise CommandError("The pool size must not be negative.")
+        if batch_size is not None and batch_size < 1:
+            raise CommandError("--batch-size must be a positive number.")
+
+        GuestModel = get_guest_model()
+        pooled = GuestModel.objects.filter(pooled=True).count()
+        created = 0
+        if pooled < size:
+            created = GuestModel.objects.create_pool(
+                size - pooled, batch_size=batch_size
+            )
+
+        if pooled + created < size:
+            raise CommandError(
+                f"Only created {created} guest users, "
+                "the username generator ran out of unused usernames."
+            )
+        if options["verbosity"] > 0:
+            self.stdout.write(
+                f"Created {created} guest users, "
+                f"the pool contains {pooled + created} guest users."
+            )
@@ -1,12 +1,215 @@
-from django.core.management.base import BaseCommand
+import argparse
+import time
+from functools import partial
+from multiprocessing import get_all_start_methods, get_context
 
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import settings
 from ...functions import get_guest_model
 
 
+def parse_shard(value):
+    """Parse a shard given as "i/N" into a zero-based index and count."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a shard like 1/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("shard must be between 1 and the shard count")
+    return index - 1, count
+
+
+def delete_shard(
+    shard,
+    batch_size=None,
+    dry_run=False,
+    sleep=0,
+    max_rows=None,
+    deadline=None,
+    resume=False,
+    progress=None,
+):
+    """
+    Delete the expired guests of one shard until a limit is reached.
+
+    Runs in the worker processes as well.
+
+    """
+    GuestModel = get_guest_model()
+    batches = GuestModel.objects.delete_expired_batches(
+        batch_size=batch_size, dry_run=dry_run, shard=shard, resume=resume
+    )
+    total = 0
+    for count in batches:
+        total += count
+        if progress is not None:
+            progress(total)
+        if (max_rows is not None and total >= max_rows) or (
+            deadline is not None and time.monotonic() >= deadline
+        ):
+            # Stop at the batch boundary, the next run resumes from here.
+            batches.close()
+            break
+        if sleep:
+            time.sleep(sleep)
+    return total
+
+
 class Command(BaseCommand):
     help = "Delete expired guest users."
 
-    def handle(self, **options):
-        """Delete every user"""
-        GuestModel = get_guest_model()
-        GuestModel.objects.delete_expired()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Number of guest users to delete at once.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to wait between two batches.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the expired guest users without deleting them.",
+        )
+        parser.add_argument(
+            "--shard",
+            type=parse_shard,
+            help=(
+                "Only delete shard i of N of the guest users, e.g. 1/4. "
+                "Run the command for every shard to delete all guest users."
+            ),
+        )
+        parser.add_argument(
+            "--max-runtime",
+            type=float,
+            help=(
+                "Stop after the first batch that ends after this many seconds. "
+                "The next run continues where this one stopped."
+            ),
+        )
+        parser.add_argument(
+            "--max-rows",
+            type=int,
+            help=(
+                "Stop after the first batch that reaches this many deleted guest users. "
+                "The next run continues where this one stopped."
+            ),
+        )
+        parser.add_argument(
+            "--no-resume",
+            action="store_false",
+            dest="resume",
+            help=(
+                "Start from the first expired guest user, "
+                "even if the last run stopped early."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes deleting guest users in parallel.",
+        )
+
+    def handle(
+        self,
+        batch_size=None,
+        sleep=0,
+        dry_run=False,
+        shard=None,
+        workers=1,
+        max_runtime=None,
+        max_rows=None,
+        resume=True,
+        **options,
+    ):
+        """Delete every expired user in batches"""
+        if batch_size is not None and batch_size < 1:
+            raise CommandError("--batch-size must be a positive number.")
+        if workers < 1:
+            raise CommandError("--workers must be a positive number.")
+        if max_rows is not None and max_rows < 1:
+            raise CommandError("--max-rows must be a positive number.")
+
+        limits = {"max_rows": max_rows, "deadline": None, "resume": False}
+        if max_runtime is not None:
+            limits["deadline"] = time.monotonic() + max_runtime
+        if resume and not dry_run and (max_rows, max_runtime) != (None, None):
+            # Only runs that may stop early need to remember their position.
+            self.check_cursor_cache()
+            limits["resume"] = True
+
+        verb = "Found" if dry_run else "Deleted"
+        if workers > 1:
+            total = self.delete_parallel(
+                shard, workers, batch_size, dry_run, sleep, **limits
+            )
+        else:
+
+            def progress(total):
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{verb} {total} expired guest users so far.")
+
+            total = delete_shard(
+                shard, batch_size, dry_run, sleep, progress=progress, **limits
+            )
+
+        if options["verbosity"] > 0:
+            self.stdout.write(f"{verb} {total} expired guest users.")
+
+    def check_cursor_cache(self):
+        """
+        Make sure the next run can read the position where this one stops.
+
+        """
+        cache = caches[settings.CLEANUP_CURSOR_CACHE]
+        if isinstance(cache, (LocMemCache, DummyCache)):
+            raise CommandError(
+                "--max-runtime and --max-rows need a shared cache to resume the next "
+                "run, set GUEST_USER_CLEANUP_CURSOR_CACHE or pass --no-resume."
+            )
+
+    def delete_parallel(
+        self, shard, workers, batch_size, dry_run, sleep, max_rows, deadline, resume
+    ):
+        """
+        Split the shard further and delete each part in its own process.
+
+        """
+        if "fork" not in get_all_start_methods():
+            raise CommandError("--workers is not supported on this platform.")
+
+        index, count = shard or (0, 1)
+        # Guests with pk % (count * workers) == index + count * n
+        # are all part of the shard pk % count == index.
+        shards = [(index + count * n, count * workers) for n in range(workers)]
+        if max_rows is not None:
+            # Share the limit between the workers.
+            max_rows = -(-max_rows // workers)
+
+        # The worker processes must not share the database connections.
+        connections.close_all()
+        context = get_context("fork")
+        with context.Pool(workers) as pool:
+            results = pool.map(
+                partial(
+                    delete_shard,
+                    batch_size=batch_size,
+                    dry_run=dry_run,
+                    sleep=sleep,
+                    max_rows=max_rows,
+                    deadline=deadline,
+                    resume=resume,
+                ),
+                shards,
+            )
+        return sum(results)
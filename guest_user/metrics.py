@@ -0,0 +1,182 @@
+"""
+In-process metrics about guest users.
+
+The library updates these metrics by itself, they can be read from the
+:data:`registry` at any time, e.g. to be scraped by Prometheus:
+
+.. code:: python
+
+    from django.http import HttpResponse
+    from guest_user.metrics import registry
+
+    def metrics(request):
+        return HttpResponse(
+            registry.render_prometheus(), content_type="text/plain; version=0.0.4"
+        )
+
+Each process keeps its own metrics. To send the metrics to an external system
+instead, implement a :class:`MetricsExporter` and add it to the
+:attr:`GUEST_USER_METRICS_EXPORTERS<guest_user.app_settings.AppSettings.METRICS_EXPORTERS>`
+setting.
+
+The following metrics are recorded:
+
+Counters
+    ``guests_created``, ``guests_blocked_user_agent``, ``guests_rate_limited``,
+    ``guests_converted``, ``guests_expired_deleted``,
+    ``guests_pooled``, ``guests_claimed``,
+    ``session_guests_created``, ``session_guests_persisted``,
+    ``username_collisions`` and ``username_retries``.
+
+Histograms (in seconds)
+    ``guest_creation_seconds``, ``guest_conversion_seconds``
+    and ``cleanup_batch_seconds``.
+
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from django.utils.module_loading import import_string
+
+from . import settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Upper bounds in seconds of the histogram buckets."""
+
+
+class Counter:
+    """A value that only ever increases."""
+
+    def __init__(self):
+        self.value = 0
+
+    def increment(self, value: int = 1):
+        self.value += value
+
+
+class Histogram:
+    """Observed values sorted into buckets."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        """Return the number of values less or equal to each bucket bound."""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsExporter:
+    """
+    Interface for sending metrics to an external system.
+
+    Exporters receive every update as it happens. They are instantiated
+    without arguments once per process.
+
+    """
+
+    def increment(self, name: str, value: int):
+        """A counter was increased by value."""
+
+    def observe(self, name: str, value: float):
+        """A value was recorded in a histogram."""
+
+
+class MetricsRegistry:
+    """Thread-safe collection of all guest user metrics of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Counter] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._exporters = None
+
+    @property
+    def exporters(self) -> List[MetricsExporter]:
+        if self._exporters is None:
+            self._exporters = [
+                import_string(path)() for path in settings.METRICS_EXPORTERS
+            ]
+        return self._exporters
+
+    def clear_exporters(self):
+        """Load the exporters from settings again on their next use."""
+        self._exporters = None
+
+    def increment(self, name: str, value: int = 1):
+        """Increase a counter."""
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = Counter()
+            counter.increment(value)
+        for exporter in self.exporters:
+            exporter.increment(name, value)
+
+    def observe(self, name: str, value: float):
+        """Record a value in a histogram."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+        for exporter in self.exporters:
+            exporter.observe(name, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record the duration of the block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str) -> int:
+        """Return the current value of a counter."""
+        with self.lock:
+            counter = self.counters.get(name)
+            return counter.value if counter is not None else 0
+
+    def reset(self):
+        """Forget all recorded values."""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self, prefix: str = "guest_user_") -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            for name, counter in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                lines.append(f"{prefix}{name}_total {counter.value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for bound, count in histogram.cumulative_counts():
+                    lines.append(f'{prefix}{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'{prefix}{name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}{name}_sum {histogram.sum}")
+                lines.append(f"{prefix}{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+"""The metrics registry updated by the library."""
@@ -0,0 +1,135 @@
+import asyncio
+import re
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+
+from . import settings
+from .functions import (
+    amaybe_create_guest_user,
+    maybe_create_guest_user,
+    restore_session_guest_user,
+    track_guest_activity,
+)
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+def compile_path_pattern(include: Optional[List[str]], exclude: List[str]):
+    """
+    Compile include and exclude patterns into a single regular expression.
+
+    :meta private:
+
+    """
+    expression = ""
+    if exclude:
+        expression += "(?!%s)" % "|".join(f"(?:{pattern})" for pattern in exclude)
+    if include is not None:
+        # An empty list of patterns must never match.
+        expression += "(?:%s)" % (
+            "|".join(f"(?:{pattern})" for pattern in include) or "(?!)"
+        )
+    return re.compile(expression)
+
+
+class GuestUserMiddleware:
+    """
+    Create guest users for anonymous visitors of matching paths.
+
+    Use this middleware instead of decorating every view with
+    :func:`@allow_guest_user<guest_user.decorators.allow_guest_user>`.
+    The paths are configured with
+    :attr:`GUEST_USER_MIDDLEWARE_INCLUDE_PATHS<guest_user.app_settings.AppSettings.MIDDLEWARE_INCLUDE_PATHS>`
+    and :attr:`GUEST_USER_MIDDLEWARE_EXCLUDE_PATHS<guest_user.app_settings.AppSettings.MIDDLEWARE_EXCLUDE_PATHS>`.
+    Requests for any other path are passed on without accessing the session.
+
+    With :attr:`GUEST_USER_SESSION_ONLY<guest_user.app_settings.AppSettings.SESSION_ONLY>`
+    enabled, the middleware also restores session-only guests on every path.
+
+    The middleware must be placed after Django's ``AuthenticationMiddleware``:
+
+    .. code:: python
+
+        MIDDLEWARE = [
+            # ...
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "guest_user.middleware.GuestUserMiddleware",
+        ]
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.path_pattern = compile_path_pattern(
+            settings.MIDDLEWARE_INCLUDE_PATHS,
+            settings.MIDDLEWARE_EXCLUDE_PATHS,
+        )
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if settings.SESSION_ONLY:
+            restore_session_guest_user(request)
+        if self.path_pattern.match(request.path_info):
+            maybe_create_guest_user(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if settings.SESSION_ONLY:
+            restore_session_guest_user(request)
+        if self.path_pattern.match(request.path_info):
+            await amaybe_create_guest_user(request)
+        return await self.get_response(request)
+
+
+class GuestActivityMiddleware:
+    """
+    Record when guest users were last active.
+
+    Required for :attr:`GUEST_USER_EXPIRE_INACTIVE<guest_user.app_settings.AppSettings.EXPIRE_INACTIVE>`.
+    The database is updated at most once per
+    :attr:`GUEST_USER_ACTIVITY_UPDATE_INTERVAL<guest_user.app_settings.AppSettings.ACTIVITY_UPDATE_INTERVAL>`
+    for each guest, requests of regular users are passed on without any queries.
+
+    The middleware must be placed after Django's ``SessionMiddleware``:
+
+    .. code:: python
+
+        MIDDLEWARE = [
+            # ...
+            "django.contrib.sessions.middleware.SessionMiddleware",
+            "guest_user.middleware.GuestActivityMiddleware",
+        ]
+
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        track_guest_activity(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        await sync_to_async(track_guest_activity)(request)
+        return await self.get_response(request)
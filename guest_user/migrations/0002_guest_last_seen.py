@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("guest_user", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="guest",
+            name="last_seen",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="Last seen"
+            ),
+        ),
+    ]
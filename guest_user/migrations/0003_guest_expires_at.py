@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("guest_user", "0002_guest_last_seen"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="guest",
+            name="expires_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="Expires at"
+            ),
+        ),
+    ]
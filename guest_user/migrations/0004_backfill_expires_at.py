@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 10000
+
+
+def backfill_expires_at(apps, schema_editor):
+    """
+    Set the expiry time of existing guests from their age.
+
+    Rows are updated in batches, each in its own transaction,
+    to avoid locking the whole table at once.
+
+    """
+    from guest_user import settings
+
+    Guest = apps.get_model("guest_user", "Guest")
+    if Guest._meta.swapped:
+        return
+
+    last_activity = F("created_at")
+    if settings.EXPIRE_INACTIVE:
+        last_activity = Coalesce("last_seen", "created_at")
+    expires_at = last_activity + timedelta(seconds=settings.MAX_AGE)
+
+    queryset = Guest.objects.using(schema_editor.connection.alias)
+    while True:
+        pks = list(
+            queryset.filter(expires_at__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not pks:
+            return
+        queryset.filter(pk__in=pks).update(expires_at=expires_at)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("guest_user", "0003_guest_expires_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+    ]
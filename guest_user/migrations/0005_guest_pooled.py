@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("guest_user", "0004_backfill_expires_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="guest",
+            name="pooled",
+            field=models.BooleanField(
+                db_index=True, default=False, verbose_name="Pooled"
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("guest_user", "0005_guest_pooled"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="guest",
+            name="session_key",
+            field=models.CharField(
+                blank=True, default="", max_length=40, verbose_name="Session key"
+            ),
+        ),
+    ]
@@ -1,9 +1,35 @@
+from inspect import isawaitable
+
 from django.conf import settings as django_settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.shortcuts import redirect
 
 from . import settings
-from .functions import is_guest_user, maybe_create_guest_user, redirect_with_next
+from .functions import (
+    aget_request_user,
+    ais_guest_user,
+    amaybe_create_guest_user,
+    has_session_cookie,
+    is_guest_user,
+    maybe_create_guest_user,
+    redirect_with_next,
+    set_anonymous_user,
+)
+
+
+async def async_dispatch(view, request, *args, **kwargs):
+    """
+    Call the next dispatch method of an async view.
+
+    Other mixins may return a response right away instead of a coroutine.
+
+    :meta private:
+
+    """
+    response = view.dispatch(request, *args, **kwargs)
+    if isawaitable(response):
+        response = await response
+    return response
 
 
 class AllowGuestUserMixin:
@@ -24,10 +50,34 @@ class AllowGuestUserMixin:
 
     """
 
+    lazy: bool = None
+    """
+    Only create the guest user once the view uses it.
+    Defaults to :attr:`GUEST_USER_LAZY<guest_user.app_settings.AppSettings.LAZY>`.
+    """
+
+    beacon: bool = False
+    """
+    Serve visitors without a session anonymously and create their guest user
+    with the :func:`guest_user_beacon<guest_user.templatetags.guest_user.guest_user_beacon>`.
+    """
+
     def dispatch(self, request, *args, **kwargs):
-        maybe_create_guest_user(request)
+        if getattr(self, "view_is_async", False):
+            return self.adispatch(request, *args, **kwargs)
+        if not self.beacon or has_session_cookie(request):
+            maybe_create_guest_user(request, lazy=self.lazy)
+        else:
+            set_anonymous_user(request)
         return super().dispatch(request, *args, **kwargs)
 
+    async def adispatch(self, request, *args, **kwargs):
+        if not self.beacon or has_session_cookie(request):
+            await amaybe_create_guest_user(request, lazy=self.lazy)
+        else:
+            set_anonymous_user(request)
+        return await async_dispatch(super(), request, *args, **kwargs)
+
 
 class GuestUserRequiredMixin:
     """
@@ -61,15 +111,26 @@ class GuestUserRequiredMixin:
     Defaults to :attr:`GUEST_USER_REQUIRED_USER_URL<guest_user.app_settings.AppSettings.REQUIRED_USER_URL>`.
     """
 
-    def dispatch(self, request, *args, **kwargs):
-        if is_guest_user(request.user):
-            return super().dispatch(request, *args, **kwargs)
-        if request.user.is_anonymous:
+    def redirect_user(self, request, user):
+        if user.is_anonymous:
             redirect_url = self.anonymous_url or settings.REQUIRED_ANON_URL
         else:
             redirect_url = self.registered_url or settings.REQUIRED_USER_URL
         return redirect(redirect_url)
 
+    def dispatch(self, request, *args, **kwargs):
+        if getattr(self, "view_is_async", False):
+            return self.adispatch(request, *args, **kwargs)
+        if is_guest_user(request.user):
+            return super().dispatch(request, *args, **kwargs)
+        return self.redirect_user(request, request.user)
+
+    async def adispatch(self, request, *args, **kwargs):
+        user = await aget_request_user(request)
+        if await ais_guest_user(user):
+            return await async_dispatch(super(), request, *args, **kwargs)
+        return self.redirect_user(request, user)
+
 
 class RegularUserRequiredMixin:
     """
@@ -117,12 +178,23 @@ class RegularUserRequiredMixin:
             return self.convert_url or settings.CONVERT_URL
         return super().get_login_url()
 
-    def dispatch(self, request, *args, **kwargs):
-        user = request.user
-        if user.is_authenticated and not is_guest_user(user):
-            return super().dispatch(request, *args, **kwargs)
+    def redirect_user(self, request, user):
         if user.is_anonymous:
             redirect_url = self.login_url or django_settings.LOGIN_URL
         else:
             redirect_url = self.convert_url or settings.CONVERT_URL
         return redirect_with_next(request, redirect_url, self.redirect_field_name)
+
+    def dispatch(self, request, *args, **kwargs):
+        if getattr(self, "view_is_async", False):
+            return self.adispatch(request, *args, **kwargs)
+        user = request.user
+        if user.is_authenticated and not is_guest_user(user):
+            return super().dispatch(request, *args, **kwargs)
+        return self.redirect_user(request, user)
+
+    async def adispatch(self, request, *args, **kwargs):
+        user = await aget_request_user(request)
+        if user.is_authenticated and not await ais_guest_user(user):
+            return await async_dispatch(super(), request, *args, **kwargs)
+        return self.redirect_user(request, user)
@@ -1,26 +1,121 @@
+from contextlib import nullcontext
 from datetime import timedelta
+from typing import Iterator, List, Optional, Tuple
 
+from asgiref.sync import sync_to_async
 from django.conf import settings as django_settings
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError, models, transaction
+from django.core.cache import caches
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import Mod
+from django.db.models.signals import post_save
 from django.forms import ModelForm
 from django.utils.module_loading import import_string
 from django.utils.timezone import now
 
 from . import settings
 from .exceptions import NotGuestError
-from .functions import is_guest_user
-from .signals import converted, guest_created
+from .functions import (
+    ais_guest_user,
+    delete_sessions,
+    is_guest_user,
+    login_guest_user,
+    set_guest_status,
+    set_guest_user_cache,
+    with_guest_status,
+)
+from .metrics import registry
+from .signals import converted, guest_created, username_collision
 
 UserModel = get_user_model()
 
+POOL_MAX_ATTEMPTS = 10
+"""Number of batches in a row that may add no guests before filling the pool stops."""
+
+CLEANUP_CURSOR_LOCK_TIMEOUT = 600
+"""Seconds after which the cleanup cursor of a job that stopped responding is released."""
+
+
+def get_expiry(max_age: int = None):
+    """
+    Return the expiry time for a guest that is active right now.
+
+    :meta private:
+
+    """
+    if max_age is None:
+        max_age = settings.MAX_AGE
+    return now() + timedelta(seconds=max_age)
+
+
+class GuestStatusQuerySetMixin:
+    """
+    Queryset mixin for custom user models.
+
+    Adds :meth:`with_guest_status` to annotate the guest status of users:
+
+    .. code:: python
+
+        class UserQuerySet(GuestStatusQuerySetMixin, models.QuerySet):
+            pass
+
+        class User(AbstractUser):
+            objects = UserManager.from_queryset(UserQuerySet)()
+
+    """
+
+    def with_guest_status(self):
+        """
+        Annotate the guest status of users in the same query.
+
+        See :func:`with_guest_status<guest_user.functions.with_guest_status>`.
+
+        """
+        return with_guest_status(self)
+
 
 class GuestQuerySet(models.QuerySet):
     def filter_expired(self):
-        delete_before = now() - timedelta(seconds=settings.MAX_AGE)
-        return self.filter(
-            created_at__lt=delete_before,
-        ).select_related("user")
+        return self.filter(expires_at__lt=now()).select_related("user")
+
+    def filter_shard(self, index: int, count: int):
+        """
+        Only include the guests of one shard.
+
+        Guests are distributed over the shards by their primary key,
+        so different shards never overlap.
+
+        :param index: The shard to include, from ``0`` to ``count - 1``.
+        :param count: The total number of shards.
+
+        """
+        return self.alias(shard=Mod("pk", count)).filter(shard=index)
+
+    def user_id_batches(self, batch_size: int = None) -> Iterator[List[int]]:
+        """
+        Iterate over the user IDs of the guests in batches.
+
+        Batches are paginated by primary key, so only a single batch
+        is held in memory at any time.
+
+        :param batch_size: Maximum number of user IDs per batch.
+          Defaults to :attr:`GUEST_USER_CLEANUP_BATCH_SIZE<guest_user.app_settings.AppSettings.CLEANUP_BATCH_SIZE>`.
+
+        """
+        if batch_size is None:
+            batch_size = settings.CLEANUP_BATCH_SIZE
+
+        queryset = self.order_by("pk").values_list("pk", "user_id")
+        last_pk = None
+        while True:
+            if last_pk is not None:
+                batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            else:
+                batch = list(queryset[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1][0]
+            yield [user_id for _pk, user_id in batch]
 
 
 class GuestManager(models.Manager.from_queryset(GuestQuerySet)):
@@ -33,7 +128,13 @@ class GuestManager(models.Manager.from_queryset(GuestQuerySet)):
     def generate_username(self):
         return import_string(settings.NAME_GENERATOR)
 
-    def create_guest_user(self, request=None, username: str = None) -> UserModel:
+    def create_guest_user(
+        self,
+        request=None,
+        username: str = None,
+        max_age: int = None,
+        login: bool = False,
+    ) -> UserModel:
         """
         Create a guest user.
 
@@ -41,25 +142,231 @@ class GuestManager(models.Manager.from_queryset(GuestQuerySet)):
 
         :param request: The current request object.
         :param username: The preferred username for the user, may be None.
+        :param max_age: Seconds until the guest expires.
+          Defaults to :attr:`GUEST_USER_MAX_AGE<guest_user.app_settings.AppSettings.MAX_AGE>`.
+        :param login: Log the guest in with the request. The Guest is inserted
+          after the login, so the key of the new session is stored right away.
+
+        If :attr:`GUEST_USER_USE_POOL<guest_user.app_settings.AppSettings.USE_POOL>`
+        is enabled and no username is given, a guest is claimed from the pool.
+        A new user is only created when the pool is empty.
 
         """
-        if username is None:
-            username = self.generate_username()
+        with registry.timer("guest_creation_seconds"):
+            user = None
+            collisions = retries = 0
+            if settings.USE_POOL and username is None:
+                user = self.claim_pooled_guest(max_age)
+                if user is not None and login:
+                    # The pooled guest exists already and needs an update.
+                    session_key = login_guest_user(request, user)
+                    self.filter(user=user).update(session_key=session_key)
+            if user is None:
+                user, collisions, retries = self._create_user(username)
+                session_key = login_guest_user(request, user) if login else ""
+                self.create(
+                    user=user,
+                    last_seen=now(),
+                    expires_at=get_expiry(max_age),
+                    session_key=session_key,
+                )
+
+        registry.increment("guests_created")
+        if collisions:
+            registry.increment("username_collisions", collisions)
+            registry.increment("username_retries", retries)
+            username_collision.send(self, collisions=collisions, retries=retries)
+        if request is not None:
+            guest_created.send(self, user=user, request=request)
+        return user
 
+    def _create_user(self, username: str = None):
+        """
+        Insert a user with the first free username.
+
+        Returns the user and the number of username collisions and retries.
+
+        """
+        collisions = 0
+        retries = 0
         user = None
         while user is None:
+            candidates = self.username_candidates(username)
+            username = None
+
+            if len(candidates) > 1:
+                taken = set(
+                    UserModel._default_manager.filter(
+                        **{f"{UserModel.USERNAME_FIELD}__in": candidates}
+                    ).values_list(UserModel.USERNAME_FIELD, flat=True)
+                )
+                collisions += len(taken)
+                candidates = [name for name in candidates if name not in taken]
+                if not candidates:
+                    retries += 1
+                    continue
+
             try:
                 with transaction.atomic():
-                    user = UserModel.objects.create_user(username, "")
+                    user = UserModel.objects.create_user(candidates[0], "")
             except IntegrityError:
                 # retry with a new username
-                username = self.generate_username()
+                collisions += 1
+                retries += 1
+
+        return user, collisions, retries
+
+    async def acreate_guest_user(
+        self,
+        request=None,
+        username: str = None,
+        max_age: int = None,
+        login: bool = False,
+    ) -> UserModel:
+        """
+        Async version of :meth:`create_guest_user`.
 
-        self.create(user=user)
-        if request is not None:
-            guest_created.send(self, user=user, request=request)
+        The user is created and logged in with a single thread hop,
+        since retrying taken usernames requires a transaction.
+
+        """
+        return await sync_to_async(self.create_guest_user)(
+            request, username, max_age, login
+        )
+
+    def claim_pooled_guest(self, max_age: int = None) -> Optional[UserModel]:
+        """
+        Take a guest user from the pool.
+
+        Concurrent requests skip guests that are locked by another
+        transaction instead of waiting for them, if the database supports it.
+
+        :param max_age: Seconds until the guest expires.
+        :returns: The user of the claimed guest, or ``None`` if the pool is empty.
+
+        """
+        pooled = self.filter(pooled=True)
+        if connection.features.has_select_for_update_skip_locked:
+            pooled = pooled.select_for_update(skip_locked=True)
+
+        with transaction.atomic():
+            row = pooled.order_by("pk").values_list("pk", "user_id").first()
+            if row is None:
+                return None
+            pk, user_id = row
+            # Without row locks, another request may have claimed it already.
+            claimed_at = now()
+            claimed = self.filter(pk=pk, pooled=True).update(
+                pooled=False,
+                created_at=claimed_at,
+                last_seen=claimed_at,
+                expires_at=get_expiry(max_age),
+            )
+        if not claimed:
+            return None
+
+        registry.increment("guests_claimed")
+        set_guest_status([user_id], True)
+        user = UserModel._default_manager.get(pk=user_id)
+        set_guest_user_cache(user, True)
         return user
 
+    def create_pool(self, count: int, batch_size: int = None) -> int:
+        """
+        Create unclaimed guest users in bulk.
+
+        Pooled guests do not expire until they are claimed by
+        :meth:`create_guest_user`. Stops early when the username generator
+        keeps generating names that are taken already.
+
+        The users are inserted in bulk instead of with ``create_user()``, custom
+        logic of the user manager is not applied. ``post_save`` is sent for every
+        user, ``pre_save`` is not.
+
+        :param count: Number of guests to add to the pool.
+        :param batch_size: Maximum number of users inserted at once.
+          Defaults to :attr:`GUEST_USER_CLEANUP_BATCH_SIZE<guest_user.app_settings.AppSettings.CLEANUP_BATCH_SIZE>`.
+        :returns: The number of created guests, which may be less than ``count``.
+
+        """
+        if batch_size is None:
+            batch_size = settings.CLEANUP_BATCH_SIZE
+
+        username_field = UserModel.USERNAME_FIELD
+        created = 0
+        failed_attempts = 0
+        while created < count and failed_attempts < POOL_MAX_ATTEMPTS:
+            usernames = list(
+                dict.fromkeys(
+                    UserModel.normalize_username(self.generate_username())
+                    for _i in range(min(batch_size, count - created))
+                )
+            )
+            taken = set(
+                UserModel._default_manager.filter(
+                    **{f"{username_field}__in": usernames}
+                ).values_list(username_field, flat=True)
+            )
+            usernames = [name for name in usernames if name not in taken]
+            if not usernames:
+                failed_attempts += 1
+                continue
+
+            users = []
+            for username in usernames:
+                user = UserModel(**{username_field: username})
+                user.set_unusable_password()
+                users.append(user)
+
+            try:
+                with transaction.atomic():
+                    UserModel._default_manager.bulk_create(users)
+                    users = UserModel._default_manager.filter(
+                        **{f"{username_field}__in": usernames}
+                    )
+                    for user in users:
+                        # Receivers may create related objects for new users,
+                        # bulk_create() doesn't send the signal like save().
+                        post_save.send(
+                            sender=UserModel,
+                            instance=user,
+                            created=True,
+                            update_fields=None,
+                            raw=False,
+                            using=user._state.db,
+                        )
+                    guests = [self.model(user=user, pooled=True) for user in users]
+                    if self.model._meta.parents:
+                        # Multi-table inheritance can't be inserted in bulk.
+                        for guest in guests:
+                            guest.save()
+                    else:
+                        self.bulk_create(guests)
+            except IntegrityError:
+                # A username was taken in the meantime, try again.
+                failed_attempts += 1
+                continue
+            created += len(guests)
+            failed_attempts = 0
+
+        registry.increment("guests_pooled", created)
+        return created
+
+    def username_candidates(self, username: str = None) -> List[str]:
+        """
+        Generate the usernames to try for a new guest user.
+
+        :param username: The preferred username, tried first if given.
+        :returns: Up to :attr:`GUEST_USER_NAME_CANDIDATES<guest_user.app_settings.AppSettings.NAME_CANDIDATES>`
+          unique usernames.
+
+        """
+        candidates = [] if username is None else [username]
+        count = max(settings.NAME_CANDIDATES, 1)
+        for _i in range(count - len(candidates)):
+            candidates.append(self.generate_username())
+        return list(dict.fromkeys(candidates))
+
     def convert(self, form: ModelForm) -> UserModel:
         """
         Convert a guest user to a regular one.
@@ -75,22 +382,147 @@ class GuestManager(models.Manager.from_queryset(GuestQuerySet)):
         if not is_guest_user(form.instance):
             raise NotGuestError("You cannot convert a non guest user")
 
-        user = form.save()
+        with registry.timer("guest_conversion_seconds"):
+            user = form.save()
 
-        # We need to remove the Guest instance assocated with the
-        # newly-converted user
-        self.filter(user=user).delete()
+            # We need to remove the Guest instance assocated with the
+            # newly-converted user
+            self.filter(user=user).delete()
+            set_guest_user_cache(user, False)
+            set_guest_status([user.pk], False)
+
+        registry.increment("guests_converted")
         converted.send(self, user=user)
         return user
 
-    def delete_expired(self):
+    async def aconvert(self, form: ModelForm) -> UserModel:
+        """
+        Async version of :meth:`convert`.
+
+        """
+        if not await ais_guest_user(form.instance):
+            raise NotGuestError("You cannot convert a non guest user")
+
+        return await sync_to_async(self.convert)(form)
+
+    def delete_users(self, user_ids: List[int], session_keys: List[str] = None) -> int:
+        """
+        Delete guest users and everything related to them.
+
+        All users are deleted with a single cascading delete.
+        The caller is responsible for passing only IDs of guest users.
+
+        The sessions of the guests are deleted as well, so requests with their
+        session cookie don't need to look up a user that doesn't exist anymore.
+
+        :param user_ids: Primary keys of the users to delete.
+        :param session_keys: Session keys of the guests, looked up if not given.
+        :returns: The number of deleted users.
+
+        """
+        if session_keys is None:
+            session_keys = list(
+                self.filter(user_id__in=user_ids).values_list("session_key", flat=True)
+            )
+        _total, deleted = UserModel._default_manager.filter(pk__in=user_ids).delete()
+        delete_sessions(session_keys)
+        set_guest_status(user_ids, None)
+        return deleted.get(UserModel._meta.label, 0)
+
+    def delete_expired_batches(
+        self,
+        batch_size: int = None,
+        dry_run: bool = False,
+        shard: Tuple[int, int] = None,
+        resume: bool = False,
+    ) -> Iterator[int]:
+        """
+        Delete expired guest users one batch at a time.
+
+        Nothing is deleted until the returned iterator is consumed,
+        which allows to report progress or pause between batches.
+
+        On databases that support ``SELECT ... FOR UPDATE SKIP LOCKED``, the guests
+        of each batch are locked in a transaction until they are deleted. Guests locked
+        by concurrent cleanup jobs are skipped, so several jobs can run at the same time
+        without deleting the same guests. Other databases delete each batch as it is
+        selected, where concurrent jobs may attempt to delete the same guests.
+
+        :param batch_size: Maximum number of users deleted at once.
+          Defaults to :attr:`GUEST_USER_CLEANUP_BATCH_SIZE<guest_user.app_settings.AppSettings.CLEANUP_BATCH_SIZE>`.
+        :param dry_run: Only count the expired guests without deleting them.
+        :param shard: Only delete the guests of one shard, given as a tuple
+          of the shard index and the number of shards. See :meth:`GuestQuerySet.filter_shard`.
+        :param resume: Continue after the last guest deleted by a previous run that was
+          stopped early. The position is kept in the cache configured with
+          :attr:`GUEST_USER_CLEANUP_CURSOR_CACHE<guest_user.app_settings.AppSettings.CLEANUP_CURSOR_CACHE>`
+          and reset once all guests have been visited. Only one job at a time uses the
+          position of a shard, concurrent jobs start from the first expired guest.
+        :returns: An iterator of the number of deleted users per batch.
+
+        """
+        queryset = self.filter_expired()
+        if shard is not None:
+            queryset = queryset.filter_shard(*shard)
+
+        if dry_run:
+            for user_ids in queryset.user_id_batches(batch_size):
+                yield len(user_ids)
+            return
+
+        if batch_size is None:
+            batch_size = settings.CLEANUP_BATCH_SIZE
+
+        rows = queryset.order_by("pk").values_list("pk", "user_id", "session_key")
+        lock = connection.features.has_select_for_update_skip_locked
+        if lock:
+            rows = rows.select_for_update(skip_locked=True)
+
+        last_pk = None
+        if resume:
+            cache = caches[settings.CLEANUP_CURSOR_CACHE]
+            cursor_key = "guest_user:cleanup_cursor:{}/{}".format(*(shard or (0, 1)))
+            lock_key = f"{cursor_key}:lock"
+            # Concurrent jobs would overwrite each other's position.
+            resume = cache.add(lock_key, True, timeout=CLEANUP_CURSOR_LOCK_TIMEOUT)
+            if resume:
+                last_pk = cache.get(cursor_key)
+
+        try:
+            while True:
+                # Without row locks, a transaction around the select would only
+                # cause lock upgrade conflicts between jobs, e.g. on SQLite.
+                with transaction.atomic() if lock else nullcontext():
+                    if last_pk is not None:
+                        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+                    else:
+                        batch = list(rows[:batch_size])
+                    if not batch:
+                        if resume:
+                            cache.delete(cursor_key)
+                        return
+                    with registry.timer("cleanup_batch_seconds"):
+                        _pks, user_ids, session_keys = zip(*batch)
+                        deleted = self.delete_users(list(user_ids), list(session_keys))
+                last_pk = batch[-1][0]
+                if resume:
+                    cache.set(cursor_key, last_pk, timeout=None)
+                    cache.touch(lock_key, timeout=CLEANUP_CURSOR_LOCK_TIMEOUT)
+                registry.increment("guests_expired_deleted", deleted)
+                yield deleted
+        finally:
+            if resume:
+                cache.delete(lock_key)
+
+    def delete_expired(self, batch_size: int = None) -> int:
         """
         Delete all expired guest users.
 
+        :param batch_size: Maximum number of users deleted at once.
+        :returns: The number of deleted users.
+
         """
-        for guest in self.filter_expired():
-            # Call delete method to trigger signals and cascades
-            guest.user.delete()
+        return sum(self.delete_expired_batches(batch_size))
 
 
 class Guest(models.Model):
@@ -100,7 +532,18 @@ class Guest(models.Model):
     Users linked to a Guest instance are considered temporary guests and will
     be deleted by cleanup jobs after their expiration.
 
-    The age of a guest user is determined by the ``created_at`` field.
+    Guest users expire at the time stored in ``expires_at``, which is set to
+    :attr:`GUEST_USER_MAX_AGE<guest_user.app_settings.AppSettings.MAX_AGE>`
+    seconds after their creation unless given explicitly. If
+    :attr:`GUEST_USER_EXPIRE_INACTIVE<guest_user.app_settings.AppSettings.EXPIRE_INACTIVE>`
+    is enabled, it is extended whenever the guest is active.
+    Guests without an expiry time are never deleted by cleanup jobs.
+
+    Pooled guests have been created in advance and are not used by anyone yet,
+    see :meth:`GuestManager.create_pool`.
+
+    The ``session_key`` of the guest's last session is stored so the session
+    can be deleted together with the guest.
 
     This model is swappable with the :attr:`GUEST_USER_MODEL<guest_user.app_settings.AppSettings.MODEL>` setting.
     Custom Guest models should use the GuestManager or a custom manager that
@@ -121,6 +564,33 @@ class Guest(models.Model):
         db_index=True,
     )
 
+    last_seen = models.DateTimeField(
+        verbose_name="Last seen",
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    expires_at = models.DateTimeField(
+        verbose_name="Expires at",
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+
+    pooled = models.BooleanField(
+        verbose_name="Pooled",
+        default=False,
+        db_index=True,
+    )
+
+    session_key = models.CharField(
+        verbose_name="Session key",
+        max_length=40,
+        blank=True,
+        default="",
+    )
+
     objects = GuestManager()
 
     class Meta:
@@ -132,9 +602,19 @@ class Guest(models.Model):
     def __str__(self):
         return str(self.user)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if adding and self.expires_at is None and not self.pooled:
+            self.expires_at = get_expiry()
+        super().save(*args, **kwargs)
+        if adding:
+            set_guest_status([self.user_id], True)
+        if self._meta.get_field("user").is_cached(self):
+            set_guest_user_cache(self.user, True)
+
     def is_expired(self) -> bool:
         """
         Check if the guest user has expired.
 
         """
-        return self.created_at < now() - timedelta(seconds=settings.MAX_AGE)
+        return self.expires_at is not None and self.expires_at < now()
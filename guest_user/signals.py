@@ -16,3 +16,15 @@ A guest user converted to a regular registered user.
 :param user: The now registered user.
 
 """
+
+username_collision = Signal()
+"""
+Generated usernames were already taken while creating a guest user.
+
+Sent once per created guest user, can be used to monitor whether
+the username generator needs more entropy.
+
+:param collisions: Number of generated usernames that were already taken.
+:param retries: Number of additional attempts needed to find a free username.
+
+"""
@@ -11,6 +11,8 @@ To use them, load them in your template:
 
 
 from django.template import Library
+from django.urls import reverse
+from django.utils.html import format_html
 
 from ..functions import is_guest_user as is_guest_user_func
 
@@ -29,3 +31,35 @@ Usage
   {% endif %}
 
 """
+
+
+BEACON_SCRIPT = (
+    "<script>"
+    'if (!sessionStorage.getItem("guest_user_beacon")) {{'
+    'sessionStorage.setItem("guest_user_beacon", "1");'
+    'fetch("{}", {{method: "POST", credentials: "same-origin", keepalive: true}});'
+    "}}"
+    "</script>"
+)
+
+
+@register.simple_tag
+def guest_user_beacon():
+    """
+    Template tag to create a guest user after the page has loaded.
+
+    Use it on pages served with
+    :func:`@allow_guest_user(beacon=True)<guest_user.decorators.allow_guest_user>`.
+    The rendered script doesn't depend on the visitor, so the page stays cacheable.
+    It calls the beacon view once per browser tab.
+    Requires the ``guest_user.urls`` to be included in your URLconf.
+
+    Usage
+
+    .. code:: jinja
+
+      {% load guest_user %}
+      {% guest_user_beacon %}
+
+    """
+    return format_html(BEACON_SCRIPT, reverse("guest_user_beacon"))
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import convert_form, convert_success
+from .views import beacon, convert_form, convert_success
 
 urlpatterns = [
     path("", convert_form, name="guest_user_convert"),
     path("success/", convert_success, name="guest_user_convert_success"),
+    path("beacon/", beacon, name="guest_user_beacon"),
 ]
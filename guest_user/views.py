@@ -1,13 +1,26 @@
 from django.conf import settings as django_settings
 from django.contrib.auth import REDIRECT_FIELD_NAME, authenticate, get_user_model, login
+from django.http import HttpResponse
 from django.shortcuts import redirect, resolve_url
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils.module_loading import import_string
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import FormView, TemplateView
 
 from . import settings
 from .exceptions import NotGuestError
-from .functions import get_guest_model, is_guest_user
+from .functions import (
+    SESSION_GUEST_KEY,
+    GuestUser,
+    get_guest_model,
+    is_guest_user,
+    maybe_create_guest_user,
+)
+
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+"""Default backend to log in converted users with."""
 
 
 class ConvertFormView(FormView):
@@ -20,6 +33,7 @@ class ConvertFormView(FormView):
     user_redirect = None
 
     success_url = None
+    login_backend = None
     redirect_field_name = REDIRECT_FIELD_NAME
     template_name = "guest_user/convert_form.html"
 
@@ -56,7 +70,10 @@ class ConvertFormView(FormView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         if self.request.method == "POST":
-            kwargs["instance"] = self.request.user
+            user = self.request.user
+            if isinstance(user, GuestUser):
+                user = user.to_user()
+            kwargs["instance"] = user
         return kwargs
 
     def get_context_data(self, **kwargs):
@@ -69,16 +86,36 @@ class ConvertFormView(FormView):
         GuestModel = get_guest_model()
 
         try:
-            GuestModel.objects.convert(form)
+            user = GuestModel.objects.convert(form)
         except NotGuestError:
             # Redirect if it's already a regular user.
             pass
         else:
-            # Authenticate the user with standard backend.
-            login(self.request, authenticate(self.request, **form.get_credentials()))
+            backend = self.get_login_backend()
+            if backend is None or getattr(form, "authenticate_on_convert", True):
+                # Authenticate the user with standard backend.
+                login(
+                    self.request, authenticate(self.request, **form.get_credentials())
+                )
+            else:
+                # The form has just set the password, no need to check it again.
+                login(self.request, user, backend=backend)
+            self.request.session.pop(SESSION_GUEST_KEY, None)
 
         return redirect(self.get_success_url())
 
+    def get_login_backend(self):
+        """
+        Return the backend to log in converted users with.
+
+        Returns ``None`` to authenticate them with their credentials instead.
+
+        """
+        backend = self.login_backend or settings.CONVERT_LOGIN_BACKEND
+        if backend is None and MODEL_BACKEND in django_settings.AUTHENTICATION_BACKENDS:
+            backend = MODEL_BACKEND
+        return backend
+
     def get_success_url(self):
         return self.get_redirect_url() or self.get_default_redirect_url()
 
@@ -110,3 +147,19 @@ class ConvertSuccessView(TemplateView):
 
 
 convert_success = ConvertSuccessView.as_view()
+
+
+@csrf_exempt
+@never_cache
+@require_POST
+def beacon(request):
+    """
+    Create a guest user for an anonymous visitor.
+
+    Called by the :func:`guest_user_beacon<guest_user.templatetags.guest_user.guest_user_beacon>`
+    on cached pages. The CSRF check is skipped, since cached pages can't
+    contain a token and the only effect is a new guest session.
+
+    """
+    maybe_create_guest_user(request, lazy=False)
+    return HttpResponse(status=204)
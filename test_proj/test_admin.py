@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.utils.timezone import now
+from guest_user.models import Guest
+
+
+@pytest.fixture
+def guests():
+    for _i in range(3):
+        Guest.objects.create_guest_user()
+    Guest.objects.update(expires_at=now() - timedelta(days=4))
+    for _i in range(2):
+        Guest.objects.create_guest_user()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guests")
+@pytest.mark.parametrize("query,count", [("", 5), ("?expired=1", 3), ("?expired=0", 2)])
+def test_admin_changelist(admin_client, query, count):
+    response = admin_client.get(f"/admin/guest_user/guest/{query}")
+    assert response.status_code == 200
+    assert response.context["cl"].result_count == count
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guests")
+def test_admin_changelist_queries(admin_client, django_assert_max_num_queries):
+    """The expiry of each row is computed by the database."""
+    with django_assert_max_num_queries(10):
+        response = admin_client.get("/admin/guest_user/guest/?o=5")
+    assert [guest.expired for guest in response.context["cl"].result_list] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guests")
+@pytest.mark.parametrize(
+    "order,expired", [("5", [None, False, True]), ("-5", [True, False, None])]
+)
+def test_admin_changelist_order_expired(admin_client, order, expired):
+    """Pooled guests never expire and are sorted with the unexpired guests."""
+    Guest.objects.create_pool(1)
+    response = admin_client.get(f"/admin/guest_user/guest/?o={order}")
+    result = [guest.expired for guest in response.context["cl"].result_list]
+    assert list(dict.fromkeys(result)) == expired
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guests")
+def test_admin_delete_expired_guests(admin_client):
+    response = admin_client.post(
+        "/admin/guest_user/guest/",
+        {
+            "action": "delete_expired_guests",
+            "_selected_action": list(Guest.objects.values_list("pk", flat=True)),
+        },
+    )
+    assert response.status_code == 302
+    assert Guest.objects.count() == 2
+    # the admin user and the remaining guests
+    assert get_user_model().objects.count() == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guests")
+def test_admin_delete_selected(admin_client):
+    selected = list(Guest.objects.values_list("pk", flat=True)[:4])
+    response = admin_client.post(
+        "/admin/guest_user/guest/",
+        {"action": "delete_selected", "_selected_action": selected, "post": "yes"},
+    )
+    assert response.status_code == 302
+    assert Guest.objects.count() == 1
+    assert get_user_model().objects.count() == 2
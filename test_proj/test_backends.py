@@ -1,7 +1,7 @@
 import pytest
 from django.contrib.auth import get_user_model
 from guest_user.backends import GuestBackend
-from guest_user.functions import get_guest_model
+from guest_user.functions import get_guest_model, is_guest_user
 
 
 @pytest.fixture
@@ -28,3 +28,23 @@ def test_backend_authenticates_guest_user(backend):
 
     backend_guest = backend.authenticate(request=None, username=guest.username)
     assert backend_guest.username == guest.username
+
+
+@pytest.mark.django_db
+def test_backend_get_user_resolves_guest_status(backend, django_assert_num_queries):
+    GuestModel = get_guest_model()
+    guest = GuestModel.objects.create_guest_user()
+
+    with django_assert_num_queries(1):
+        user = backend.get_user(guest.pk)
+        assert is_guest_user(user)
+
+
+@pytest.mark.django_db
+def test_backend_get_user_resolves_regular_status(backend, django_assert_num_queries):
+    UserModel = get_user_model()
+    regular = UserModel.objects.create_user(username="demo")
+
+    with django_assert_num_queries(1):
+        user = backend.get_user(regular.pk)
+        assert not is_guest_user(user)
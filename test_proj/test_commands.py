@@ -0,0 +1,201 @@
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.utils.timezone import now
+from guest_user.functions import get_guest_model
+
+
+@pytest.fixture
+def cursor_cache(settings, tmp_path):
+    settings.CACHES = {
+        **settings.CACHES,
+        "cursor": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path),
+        },
+    }
+    settings.GUEST_USER_CLEANUP_CURSOR_CACHE = "cursor"
+
+
+@pytest.fixture
+def expired_guests():
+    GuestModel = get_guest_model()
+    for _i in range(3):
+        GuestModel.objects.create_guest_user()
+    GuestModel.objects.update(expires_at=now() - timedelta(days=4))
+    GuestModel.objects.create_guest_user()
+
+
+@pytest.mark.django_db
+def test_delete_expired_users(expired_guests):
+    out = StringIO()
+    call_command("delete_expired_users", "--batch-size=2", "-v2", stdout=out)
+
+    assert out.getvalue().splitlines() == [
+        "Deleted 2 expired guest users so far.",
+        "Deleted 3 expired guest users so far.",
+        "Deleted 3 expired guest users.",
+    ]
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_delete_expired_users_dry_run(expired_guests):
+    out = StringIO()
+    call_command("delete_expired_users", "--dry-run", stdout=out)
+
+    assert out.getvalue() == "Found 3 expired guest users.\n"
+    assert get_guest_model().objects.count() == 4
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("cursor_cache")
+def test_delete_expired_users_max_rows(expired_guests):
+    GuestModel = get_guest_model()
+    first_guest = GuestModel.objects.order_by("pk").first()
+    GuestModel.objects.filter(pk=first_guest.pk).update(
+        expires_at=now() + timedelta(days=1)
+    )
+
+    out = StringIO()
+    call_command("delete_expired_users", "--batch-size=1", "--max-rows=1", stdout=out)
+    assert out.getvalue() == "Deleted 1 expired guest users.\n"
+
+    # The next run continues after the last deleted guest.
+    GuestModel.objects.filter(pk=first_guest.pk).update(expires_at=now())
+    out = StringIO()
+    call_command("delete_expired_users", "--max-rows=10", stdout=out)
+    assert out.getvalue() == "Deleted 1 expired guest users.\n"
+    assert GuestModel.objects.filter(pk=first_guest.pk).exists()
+
+    # All guests have been visited, the run after starts from the beginning.
+    out = StringIO()
+    call_command("delete_expired_users", "--max-rows=10", stdout=out)
+    assert out.getvalue() == "Deleted 1 expired guest users.\n"
+    assert not GuestModel.objects.filter(pk=first_guest.pk).exists()
+    assert GuestModel.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_delete_expired_users_max_runtime(expired_guests):
+    out = StringIO()
+    call_command(
+        "delete_expired_users",
+        "--batch-size=2",
+        "--max-runtime=0",
+        "--no-resume",
+        stdout=out,
+    )
+    assert out.getvalue() == "Deleted 2 expired guest users.\n"
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("cursor_cache")
+def test_delete_expired_users_no_resume(expired_guests):
+    GuestModel = get_guest_model()
+    first_guest = GuestModel.objects.order_by("pk").first()
+    GuestModel.objects.filter(pk=first_guest.pk).update(
+        expires_at=now() + timedelta(days=1)
+    )
+    call_command("delete_expired_users", "--batch-size=1", "--max-rows=1")
+
+    # Guests before the position of the last run are deleted as well.
+    GuestModel.objects.filter(pk=first_guest.pk).update(expires_at=now())
+    out = StringIO()
+    call_command("delete_expired_users", "--max-rows=10", "--no-resume", stdout=out)
+    assert out.getvalue() == "Deleted 2 expired guest users.\n"
+
+
+@pytest.mark.django_db
+def test_delete_expired_users_local_cursor_cache(expired_guests):
+    """A local memory cache isn't shared with the next run."""
+    with pytest.raises(CommandError, match="GUEST_USER_CLEANUP_CURSOR_CACHE"):
+        call_command("delete_expired_users", "--max-rows=1")
+    assert get_guest_model().objects.count() == 4
+
+
+def test_delete_expired_users_invalid_batch_size():
+    with pytest.raises(CommandError):
+        call_command("delete_expired_users", "--batch-size=0")
+
+
+@pytest.mark.django_db
+def test_delete_expired_users_shards(expired_guests):
+    for shard in ["1/2", "2/2"]:
+        call_command("delete_expired_users", f"--shard={shard}", verbosity=0)
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.mark.parametrize("shard", ["0/2", "3/2", "1", "a/b"])
+def test_delete_expired_users_invalid_shard(shard):
+    with pytest.raises(CommandError):
+        call_command("delete_expired_users", f"--shard={shard}")
+
+
+class SerialPool:
+    """Run the workers one after another, processes can't share the test database."""
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def map(self, func, iterable):
+        return [func(item) for item in iterable]
+
+
+@pytest.mark.django_db
+def test_delete_expired_users_workers(expired_guests):
+    GuestModel = get_guest_model()
+    expired = GuestModel.objects.filter_expired()
+    odd = expired.filter_shard(1, 2).count()
+
+    out = StringIO()
+    with mock.patch(
+        "guest_user.management.commands.delete_expired_users.get_context",
+        return_value=SimpleNamespace(Pool=SerialPool),
+    ):
+        call_command("delete_expired_users", "--workers=3", "--shard=2/2", stdout=out)
+        call_command("delete_expired_users", "--workers=2", "--shard=1/2", stdout=out)
+
+    assert out.getvalue().splitlines() == [
+        f"Deleted {odd} expired guest users.",
+        f"Deleted {3 - odd} expired guest users.",
+    ]
+    assert GuestModel.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_create_guest_pool():
+    out = StringIO()
+    call_command("create_guest_pool", "3", "--batch-size=2", stdout=out)
+    assert out.getvalue() == "Created 3 guest users, the pool contains 3 guest users.\n"
+
+    GuestModel = get_guest_model()
+    assert GuestModel.objects.filter(pooled=True, expires_at=None).count() == 3
+
+    # Only the missing guests are created.
+    out = StringIO()
+    call_command("create_guest_pool", "4", stdout=out)
+    assert out.getvalue() == "Created 1 guest users, the pool contains 4 guest users.\n"
+
+
+def single_name_generator():
+    return "single_guest"
+
+
+@pytest.mark.django_db
+def test_create_guest_pool_usernames_exhausted(settings):
+    """Filling the pool stops once no unused usernames are generated anymore."""
+    settings.GUEST_USER_NAME_GENERATOR = "test_proj.test_commands.single_name_generator"
+    with pytest.raises(CommandError, match="Only created 1 guest users"):
+        call_command("create_guest_pool", "3", stdout=StringIO())
+    assert get_guest_model().objects.count() == 1
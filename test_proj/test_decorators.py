@@ -1,14 +1,33 @@
+import re
+
+import django
 import pytest
-from guest_user.functions import is_guest_user
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import cache
+from django.test import Client
+from guest_user.backends import GuestBackend
+from guest_user.functions import get_guest_model, is_guest_user
 from guest_user.signals import guest_created
 
+async_class_view = pytest.mark.skipif(
+    django.VERSION < (4, 1), reason="Async class-based views require Django 4.1"
+)
+
 # see views.py for view functions used in these tests
 # this file, despite its name, also tests the class based mixins
 # as they are all based on the functions in the `helper` module
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("url", ["/allow_guest_user/", "/mixin/allow_guest_user/"])
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/allow_guest_user/",
+        "/mixin/allow_guest_user/",
+        "/async/allow_guest_user/",
+        pytest.param("/async/mixin/allow_guest_user/", marks=async_class_view),
+    ],
+)
 def test_allow_guest_user_with_anonymous(client, url):
     """
     Unauthenticated visitors get automatically logged in as a guest user.
@@ -23,7 +42,15 @@ def test_allow_guest_user_with_anonymous(client, url):
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("url", ["/allow_guest_user/", "/mixin/allow_guest_user/"])
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/allow_guest_user/",
+        "/mixin/allow_guest_user/",
+        "/async/allow_guest_user/",
+        pytest.param("/async/mixin/allow_guest_user/", marks=async_class_view),
+    ],
+)
 def test_allow_guest_user_sends_signal(client, url):
     """
     Check that the guest_created signal is sent with the current request.
@@ -46,7 +73,15 @@ def test_allow_guest_user_sends_signal(client, url):
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("url", ["/allow_guest_user/", "/mixin/allow_guest_user/"])
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/allow_guest_user/",
+        "/mixin/allow_guest_user/",
+        "/async/allow_guest_user/",
+        pytest.param("/async/mixin/allow_guest_user/", marks=async_class_view),
+    ],
+)
 @pytest.mark.parametrize(
     "useragent",
     [
@@ -67,7 +102,15 @@ def test_allow_guest_user_ignores_robots(client, url, useragent):
 
 
 @pytest.mark.django_db
-@pytest.mark.parametrize("url", ["/allow_guest_user/", "/mixin/allow_guest_user/"])
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/allow_guest_user/",
+        "/mixin/allow_guest_user/",
+        "/async/allow_guest_user/",
+        pytest.param("/async/mixin/allow_guest_user/", marks=async_class_view),
+    ],
+)
 def test_allow_guest_user_with_authenticated(authenticated_client, url):
     """
     Authenticated visitors should stay logged in.
@@ -82,7 +125,13 @@ def test_allow_guest_user_with_authenticated(authenticated_client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/guest_user_required/", "/mixin/guest_user_required/"]
+    "url",
+    [
+        "/guest_user_required/",
+        "/mixin/guest_user_required/",
+        "/async/guest_user_required/",
+        pytest.param("/async/mixin/guest_user_required/", marks=async_class_view),
+    ],
 )
 def test_guest_user_required_with_anonymous(client, url):
     """
@@ -98,7 +147,13 @@ def test_guest_user_required_with_anonymous(client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/guest_user_required/", "/mixin/guest_user_required/"]
+    "url",
+    [
+        "/guest_user_required/",
+        "/mixin/guest_user_required/",
+        "/async/guest_user_required/",
+        pytest.param("/async/mixin/guest_user_required/", marks=async_class_view),
+    ],
 )
 def test_guest_user_required_with_authenticated(authenticated_client, url):
     """
@@ -113,7 +168,13 @@ def test_guest_user_required_with_authenticated(authenticated_client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/guest_user_required/", "/mixin/guest_user_required/"]
+    "url",
+    [
+        "/guest_user_required/",
+        "/mixin/guest_user_required/",
+        "/async/guest_user_required/",
+        pytest.param("/async/mixin/guest_user_required/", marks=async_class_view),
+    ],
 )
 def test_guest_user_required_with_guest_user(guest_client, url):
     response = guest_client.get(url)
@@ -125,7 +186,13 @@ def test_guest_user_required_with_guest_user(guest_client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/regular_user_required/", "/mixin/regular_user_required/"]
+    "url",
+    [
+        "/regular_user_required/",
+        "/mixin/regular_user_required/",
+        "/async/regular_user_required/",
+        pytest.param("/async/mixin/regular_user_required/", marks=async_class_view),
+    ],
 )
 def test_regular_user_required_with_anonymous(client, url):
     response = client.get(url)
@@ -135,7 +202,13 @@ def test_regular_user_required_with_anonymous(client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/regular_user_required/", "/mixin/regular_user_required/"]
+    "url",
+    [
+        "/regular_user_required/",
+        "/mixin/regular_user_required/",
+        "/async/regular_user_required/",
+        pytest.param("/async/mixin/regular_user_required/", marks=async_class_view),
+    ],
 )
 def test_regular_user_required_with_guest(guest_client, url):
     response = guest_client.get(url)
@@ -146,7 +219,13 @@ def test_regular_user_required_with_guest(guest_client, url):
 
 @pytest.mark.django_db
 @pytest.mark.parametrize(
-    "url", ["/regular_user_required/", "/mixin/regular_user_required/"]
+    "url",
+    [
+        "/regular_user_required/",
+        "/mixin/regular_user_required/",
+        "/async/regular_user_required/",
+        pytest.param("/async/mixin/regular_user_required/", marks=async_class_view),
+    ],
 )
 def test_regular_user_required_with_authenticated(authenticated_client, url):
     response = authenticated_client.get(url)
@@ -155,3 +234,127 @@ def test_regular_user_required_with_authenticated(authenticated_client, url):
     assert not response_user.is_anonymous
     assert response_user.username == "registered_user"
     assert not is_guest_user(response_user)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url", ["/allow_guest_user/lazy/", "/mixin/allow_guest_user/lazy/"]
+)
+def test_allow_guest_user_lazy_without_access(client, url):
+    """
+    A lazy guest is authenticated but nothing is written until it is used.
+
+    """
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == b"True"
+    assert get_guest_model().objects.count() == 0
+    assert "sessionid" not in response.cookies
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url", ["/allow_guest_user/lazy/", "/mixin/allow_guest_user/lazy/"]
+)
+def test_allow_guest_user_lazy_with_access(client, url):
+    """
+    Accessing the primary key creates the guest and logs them in.
+
+    """
+    response = client.get(url, {"pk": 1})
+    assert response.status_code == 200
+    guest = get_guest_model().objects.get()
+    assert response.content == str(guest.user_id).encode()
+    assert "sessionid" in response.cookies
+
+    # The next request uses the same guest user.
+    response = client.get(url, {"pk": 1})
+    assert response.content == str(guest.user_id).encode()
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_allow_guest_user_lazy_csrf_token():
+    """
+    CSRF tokens rendered before the lazy guest was created stay valid.
+
+    """
+    client = Client(enforce_csrf_checks=True)
+    response = client.get("/allow_guest_user/lazy/form/")
+    guest = get_guest_model().objects.get()
+    token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content)
+
+    response = client.post(
+        "/allow_guest_user/lazy/form/", {"csrfmiddlewaretoken": token[1].decode()}
+    )
+    assert response.status_code == 200
+    assert response.content == guest.user.username.encode()
+
+
+@pytest.mark.django_db
+def test_allow_guest_user_lazy_setting(settings, client):
+    settings.GUEST_USER_LAZY = True
+
+    response = client.get("/allow_guest_user/")
+    assert response.status_code == 200
+    # The template renders the username, which creates the guest.
+    assert get_guest_model().objects.count() == 1
+    assert "sessionid" in response.cookies
+
+
+@pytest.mark.django_db
+def test_allow_guest_user_skips_authenticate(client, monkeypatch):
+    """
+    New guests are logged in directly with the guest backend.
+
+    """
+
+    def _authenticate(*args, **kwargs):
+        raise AssertionError("authenticate() should not be called")
+
+    monkeypatch.setattr(GuestBackend, "authenticate", _authenticate)
+
+    response = client.get("/allow_guest_user/")
+    assert response.status_code == 200
+    assert client.session[BACKEND_SESSION_KEY] == "guest_user.backends.GuestBackend"
+    assert is_guest_user(response.context["user"])
+
+
+@pytest.mark.django_db
+def test_allow_guest_user_rate_limited(client, settings):
+    """
+    Clients that created too many guests are served anonymously.
+
+    """
+    settings.GUEST_USER_RATE_LIMIT = (1, 60)
+    cache.clear()
+
+    response = client.get("/allow_guest_user/")
+    assert is_guest_user(response.context["user"])
+
+    client.logout()
+    response = client.get("/allow_guest_user/")
+    assert response.status_code == 200
+    assert response.context["user"].is_anonymous
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_allow_guest_user_lazy_rate_limited(client, settings):
+    """
+    Lazy guests only count towards the rate limit once they are created.
+
+    """
+    settings.GUEST_USER_RATE_LIMIT = (1, 60)
+    cache.clear()
+
+    for _i in range(3):
+        response = client.get("/allow_guest_user/lazy/")
+        assert response.content == b"True"
+
+    response = client.get("/allow_guest_user/lazy/", {"pk": 1})
+    assert response.content == str(get_guest_model().objects.get().user_id).encode()
+
+    client.logout()
+    response = client.get("/allow_guest_user/lazy/")
+    assert response.content == b"False"
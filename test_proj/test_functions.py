@@ -1,10 +1,26 @@
 import pytest
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.template import Context, Template
+from guest_user.forms import UserCreationForm
 from guest_user.functions import (
+    ais_guest_user,
+    SESSION_GUEST_KEY,
+    GuestUser,
     generate_numbered_username,
     generate_uuid_username,
+    get_client_network,
     get_guest_model,
+    is_blocked_user_agent,
     is_guest_user,
+    is_rate_limited,
+    maybe_create_guest_user,
+    persist_guest_user,
+    with_guest_status,
 )
 
 
@@ -20,6 +36,85 @@ def test_is_guest_user():
     assert is_guest_user(user) is True
 
 
+@pytest.mark.django_db
+def test_ais_guest_user_without_async_queries(monkeypatch):
+    """Django < 4.1 has no async queries, the check runs in a thread."""
+    monkeypatch.delattr(QuerySet, "aexists")
+    GuestModel = get_guest_model()
+    guest = GuestModel.objects.create_guest_user()
+    regular = get_user_model().objects.create_user("regular")
+
+    assert async_to_sync(ais_guest_user)(get_user_model().objects.get(pk=guest.pk))
+    assert not async_to_sync(ais_guest_user)(regular)
+
+
+@pytest.mark.django_db
+def test_is_guest_user_cached(django_assert_num_queries):
+    """Repeated checks for the same user instance query only once."""
+    UserModel = get_user_model()
+    user = UserModel.objects.create_user("dummy")
+
+    with django_assert_num_queries(1):
+        assert is_guest_user(user) is False
+        assert is_guest_user(user) is False
+
+    user = UserModel.objects.get(pk=user.pk)
+    get_guest_model().objects.create(user=user)
+    with django_assert_num_queries(0):
+        assert is_guest_user(user) is True
+
+
+@pytest.mark.django_db
+def test_is_guest_user_status_cache(settings, django_assert_num_queries):
+    settings.GUEST_USER_STATUS_CACHE = "default"
+    cache.clear()
+    UserModel = get_user_model()
+    GuestModel = get_guest_model()
+    user = UserModel.objects.create_user("dummy")
+    guest = GuestModel.objects.create_guest_user()
+
+    assert is_guest_user(UserModel.objects.get(pk=user.pk)) is False
+    with django_assert_num_queries(0):
+        assert is_guest_user(UserModel(pk=user.pk)) is False
+        # Guests are registered when they are created.
+        assert is_guest_user(UserModel(pk=guest.pk)) is True
+
+    form = UserCreationForm(
+        instance=guest,
+        data={
+            "username": "cachedBaron45",
+            "password1": "7mashedPotatoes",
+            "password2": "7mashedPotatoes",
+        },
+    )
+    assert form.is_valid(), form.errors
+    GuestModel.objects.convert(form)
+    with django_assert_num_queries(0):
+        assert is_guest_user(UserModel(pk=guest.pk)) is False
+
+    expired = GuestModel.objects.create_guest_user()
+    GuestModel.objects.filter(user=expired).update(expires_at="2000-01-01T00:00Z")
+    GuestModel.objects.delete_expired()
+    assert cache.get(f"guest_user:is_guest:{expired.pk}") is None
+
+
+@pytest.mark.django_db
+def test_with_guest_status(django_assert_num_queries):
+    UserModel = get_user_model()
+    for _i in range(3):
+        get_guest_model().objects.create_guest_user()
+    for name in ["alice", "bob"]:
+        UserModel.objects.create_user(name)
+
+    template = Template(
+        "{% load guest_user %}{% for user in users %}{{ user|is_guest_user }} {% endfor %}"
+    )
+    with django_assert_num_queries(1):
+        users = with_guest_status(UserModel.objects.order_by("pk"))
+        rendered = template.render(Context({"users": users}))
+    assert rendered.split() == ["True", "True", "True", "False", "False"]
+
+
 def test_generate_uuid_username():
     uuid_username = generate_uuid_username()
     assert len(uuid_username) == 32
@@ -61,3 +156,77 @@ def test_generate_numbered_username_unique():
     count = 1000  # 10% of a 4 digit number space
     names = {generate_numbered_username() for _ in range(count)}
     assert len(names) > 900  # still enough?
+
+
+@pytest.mark.parametrize(
+    "useragent,blocked",
+    [
+        (
+            "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+            True,
+        ),
+        ("facebookexternalhit/1.1", True),
+        (
+            "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/118.0",
+            False,
+        ),
+        ("", False),
+    ],
+)
+def test_is_blocked_user_agent(useragent, blocked):
+    assert is_blocked_user_agent(useragent) is blocked
+
+
+@pytest.mark.parametrize(
+    "address,network",
+    [
+        ("203.0.113.7", "203.0.113.7"),
+        ("2001:db8:1:2:3:4:5:6", "2001:db8:1:2::/64"),
+        ("", None),
+    ],
+)
+def test_get_client_network(rf, address, network):
+    request = rf.get("/", REMOTE_ADDR=address)
+    assert get_client_network(request) == network
+
+
+def test_is_rate_limited(rf, settings):
+    settings.GUEST_USER_RATE_LIMIT = (2, 60)
+    cache.clear()
+
+    request = rf.get("/", REMOTE_ADDR="203.0.113.7")
+    assert not is_rate_limited(request)
+    assert not is_rate_limited(request)
+    assert is_rate_limited(request)
+
+    other_request = rf.get("/", REMOTE_ADDR="203.0.113.8")
+    assert not is_rate_limited(other_request)
+
+
+def test_is_rate_limited_disabled(rf):
+    request = rf.get("/")
+    assert not any(is_rate_limited(request) for _i in range(100))
+
+
+@pytest.mark.django_db
+def test_persist_guest_user(rf, settings):
+    settings.GUEST_USER_SESSION_ONLY = True
+    request = rf.get("/")
+    request.session = SessionStore()
+    request.user = AnonymousUser()
+
+    maybe_create_guest_user(request)
+    guest = request.user
+    assert isinstance(guest, GuestUser)
+    assert get_user_model().objects.count() == 0
+
+    user = persist_guest_user(request)
+    assert user.pk is not None
+    assert user.username == guest.username
+    assert is_guest_user(user)
+    assert request.user == user
+    assert SESSION_GUEST_KEY not in request.session
+    assert get_guest_model().objects.filter(user=user).exists()
+
+    # Regular users are returned as they are.
+    assert persist_guest_user(request) == user
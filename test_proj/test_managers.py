@@ -1,9 +1,15 @@
 from datetime import timedelta
+from importlib import import_module
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_save
 from django.utils.timezone import now
+from guest_user.exceptions import NotGuestError
 from guest_user.forms import UserCreationForm
-from guest_user.functions import get_guest_model, is_guest_user
+from guest_user.functions import ais_guest_user, get_guest_model, is_guest_user
 from guest_user.signals import converted
 
 
@@ -15,15 +21,79 @@ def test_manager_filter_expired():
         GuestModel.objects.create_guest_user()
 
     old_user = GuestModel.objects.create_guest_user()
-    # Force update the created_at timestamp
+    # Force update the expires_at timestamp
     old_guest = GuestModel.objects.filter(user=old_user)
-    old_guest.update(created_at=now() - timedelta(days=25))
-    assert old_guest.get().is_expired(), old_user.guest.created_at
+    old_guest.update(expires_at=now() - timedelta(days=1))
+    assert old_guest.get().is_expired()
 
     assert GuestModel.objects.count() == 4
     assert GuestModel.objects.filter_expired().count() == 1
 
 
+@pytest.mark.django_db
+def test_manager_expires_at(settings):
+    settings.GUEST_USER_MAX_AGE = 3600
+    GuestModel = get_guest_model()
+
+    default = GuestModel.objects.get(user=GuestModel.objects.create_guest_user())
+    assert abs(
+        default.expires_at - default.created_at - timedelta(hours=1)
+    ) < timedelta(seconds=1)
+
+    short = GuestModel.objects.get(
+        user=GuestModel.objects.create_guest_user(max_age=60)
+    )
+    assert abs(short.expires_at - short.created_at - timedelta(minutes=1)) < timedelta(
+        seconds=1
+    )
+
+    # Guests without an expiry time are kept forever.
+    GuestModel.objects.update(expires_at=now() - timedelta(days=1))
+    GuestModel.objects.filter(pk=short.pk).update(expires_at=None)
+    assert not GuestModel.objects.get(pk=short.pk).is_expired()
+    assert list(GuestModel.objects.filter_expired()) == [default]
+
+
+@pytest.mark.django_db
+def test_manager_claim_pooled_guest(settings):
+    settings.GUEST_USER_USE_POOL = True
+    GuestModel = get_guest_model()
+    assert GuestModel.objects.create_pool(2) == 2
+    pooled_ids = set(GuestModel.objects.values_list("user_id", flat=True))
+
+    first = GuestModel.objects.create_guest_user()
+    second = GuestModel.objects.create_guest_user()
+    assert {first.pk, second.pk} == pooled_ids
+    assert is_guest_user(first)
+
+    guest = GuestModel.objects.get(user=first)
+    assert not guest.pooled
+    assert guest.expires_at is not None
+
+    # The pool is empty, a new guest is created.
+    third = GuestModel.objects.create_guest_user()
+    assert third.pk not in pooled_ids
+    assert GuestModel.objects.filter(pooled=True).count() == 0
+
+
+@pytest.mark.django_db
+def test_manager_create_pool_sends_post_save():
+    """Receivers for new users are called for pooled users as well."""
+    created = []
+
+    def receiver(sender, instance, **kwargs):
+        created.append((instance.pk, kwargs["created"]))
+
+    post_save.connect(receiver, sender=get_user_model())
+    try:
+        assert get_guest_model().objects.create_pool(3, batch_size=2) == 3
+    finally:
+        post_save.disconnect(receiver, sender=get_user_model())
+
+    user_ids = get_guest_model().objects.values_list("user_id", flat=True)
+    assert sorted(created) == [(pk, True) for pk in sorted(user_ids)]
+
+
 @pytest.mark.django_db
 def test_manager_delete_expired():
     GuestModel = get_guest_model()
@@ -31,16 +101,112 @@ def test_manager_delete_expired():
     for _i in range(3):
         GuestModel.objects.create_guest_user()
 
-    GuestModel.objects.update(created_at=now() - timedelta(days=18))
+    GuestModel.objects.update(expires_at=now() - timedelta(days=4))
 
     for _i in range(2):
         GuestModel.objects.create_guest_user()
 
     assert GuestModel.objects.count() == 5
-    GuestModel.objects.delete_expired()
+    assert GuestModel.objects.delete_expired() == 3
     assert GuestModel.objects.count() == 2
 
 
+@pytest.mark.django_db
+def test_manager_delete_expired_batches():
+    GuestModel = get_guest_model()
+    UserModel = get_user_model()
+
+    for _i in range(5):
+        GuestModel.objects.create_guest_user()
+    GuestModel.objects.update(expires_at=now() - timedelta(days=4))
+    GuestModel.objects.create_guest_user()
+    UserModel.objects.create_user("regular")
+
+    batches = GuestModel.objects.delete_expired_batches(batch_size=2, dry_run=True)
+    assert list(batches) == [2, 2, 1]
+    assert GuestModel.objects.count() == 6
+
+    batches = GuestModel.objects.delete_expired_batches(batch_size=2)
+    assert list(batches) == [2, 2, 1]
+    assert GuestModel.objects.count() == 1
+    assert UserModel.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_manager_delete_expired_concurrently():
+    GuestModel = get_guest_model()
+    for _i in range(5):
+        GuestModel.objects.create_guest_user()
+    GuestModel.objects.update(expires_at=now() - timedelta(days=4))
+
+    first = GuestModel.objects.delete_expired_batches(batch_size=2)
+    assert next(first) == 2
+    # Another job deletes the remaining guests in the meantime.
+    assert GuestModel.objects.delete_expired(batch_size=2) == 3
+    assert list(first) == []
+    assert GuestModel.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_manager_delete_expired_resume_concurrently():
+    """Only one job at a time keeps the position of a shard."""
+    GuestModel = get_guest_model()
+    for _i in range(3):
+        GuestModel.objects.create_guest_user()
+    GuestModel.objects.update(expires_at=now() - timedelta(days=1))
+    cursor_key = "guest_user:cleanup_cursor:0/1"
+
+    first = GuestModel.objects.delete_expired_batches(batch_size=1, resume=True)
+    assert next(first) == 1
+    last_pk = cache.get(cursor_key)
+    assert last_pk is not None
+
+    second = GuestModel.objects.delete_expired_batches(batch_size=1, resume=True)
+    assert sum(second) == 2
+    assert cache.get(cursor_key) == last_pk
+
+    first.close()
+    assert cache.get(f"{cursor_key}:lock") is None
+    cache.delete(cursor_key)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "django.contrib.sessions.backends.db",
+        "django.contrib.sessions.backends.cache",
+        "django.contrib.sessions.backends.cached_db",
+    ],
+)
+def test_manager_delete_expired_sessions(client, settings, engine):
+    settings.SESSION_ENGINE = engine
+    GuestModel = get_guest_model()
+    client.get("/allow_guest_user/")
+    session_key = client.session.session_key
+    assert GuestModel.objects.get().session_key == session_key
+
+    SessionStore = import_module(engine).SessionStore
+    assert SessionStore().exists(session_key)
+
+    GuestModel.objects.update(expires_at=now() - timedelta(days=1))
+    assert GuestModel.objects.delete_expired() == 1
+    assert not SessionStore().exists(session_key)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("use_pool", [False, True])
+@pytest.mark.parametrize("url", ["/allow_guest_user/", "/async/allow_guest_user/"])
+def test_manager_stores_session_key(client, settings, url, use_pool):
+    settings.GUEST_USER_USE_POOL = use_pool
+    GuestModel = get_guest_model()
+    GuestModel.objects.create_pool(1)
+
+    client.get(url)
+    guest = GuestModel.objects.get(pooled=False)
+    assert guest.session_key == client.session.session_key
+
+
 @pytest.mark.django_db
 def test_convert_sends_signal():
     GuestModel = get_guest_model()
@@ -72,3 +238,27 @@ def test_convert_sends_signal():
 
     assert not is_guest_user(converted_user)
     assert guest_user.id == converted_user.id
+
+
+@pytest.mark.django_db
+def test_async_create_and_convert():
+    GuestModel = get_guest_model()
+    guest_user = async_to_sync(GuestModel.objects.acreate_guest_user)()
+    assert async_to_sync(ais_guest_user)(guest_user)
+
+    form = UserCreationForm(
+        instance=guest_user,
+        data={
+            "username": "asyncBaron45",
+            "password1": "7mashedPotatoes",
+            "password2": "7mashedPotatoes",
+        },
+    )
+    assert form.is_valid(), form.errors
+
+    converted_user = async_to_sync(GuestModel.objects.aconvert)(form)
+    assert not async_to_sync(ais_guest_user)(converted_user)
+    assert not GuestModel.objects.filter(user=converted_user).exists()
+
+    with pytest.raises(NotGuestError):
+        async_to_sync(GuestModel.objects.aconvert)(form)
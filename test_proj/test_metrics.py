@@ -0,0 +1,72 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from guest_user.functions import get_guest_model, maybe_create_guest_user
+from guest_user.metrics import MetricsExporter, registry
+
+recorded = []
+
+
+class RecordingExporter(MetricsExporter):
+    def increment(self, name, value):
+        recorded.append(("increment", name, value))
+
+    def observe(self, name, value):
+        recorded.append(("observe", name, value))
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    registry.reset()
+    recorded.clear()
+    yield
+    registry.reset()
+
+
+def test_render_prometheus():
+    registry.increment("guests_created", 2)
+    registry.observe("guest_creation_seconds", 0.003)
+    registry.observe("guest_creation_seconds", 20)
+
+    output = registry.render_prometheus()
+    assert "guest_user_guests_created_total 2\n" in output
+    assert 'guest_user_guest_creation_seconds_bucket{le="0.001"} 0\n' in output
+    assert 'guest_user_guest_creation_seconds_bucket{le="0.005"} 1\n' in output
+    assert 'guest_user_guest_creation_seconds_bucket{le="10"} 1\n' in output
+    assert 'guest_user_guest_creation_seconds_bucket{le="+Inf"} 2\n' in output
+    assert "guest_user_guest_creation_seconds_count 2\n" in output
+
+
+@pytest.mark.django_db
+def test_guest_lifecycle_metrics():
+    GuestModel = get_guest_model()
+    user = GuestModel.objects.create_guest_user()
+    assert registry.get("guests_created") == 1
+    assert registry.histograms["guest_creation_seconds"].count == 1
+
+    GuestModel.objects.filter(user=user).update(expires_at="2000-01-01T00:00Z")
+    assert GuestModel.objects.delete_expired() == 1
+    assert registry.get("guests_expired_deleted") == 1
+    assert registry.histograms["cleanup_batch_seconds"].count == 1
+
+
+@pytest.mark.django_db
+def test_blocked_user_agent_metric(rf, settings):
+    settings.GUEST_USER_BLOCKED_USER_AGENTS = ["Bot"]
+    request = rf.get("/", HTTP_USER_AGENT="SomeBot/1.0")
+    request.session = {}
+    request.user = AnonymousUser()
+
+    maybe_create_guest_user(request)
+    assert registry.get("guests_blocked_user_agent") == 1
+    assert registry.get("guests_created") == 0
+
+
+@pytest.mark.django_db
+def test_exporters(settings):
+    settings.GUEST_USER_METRICS_EXPORTERS = ["test_proj.test_metrics.RecordingExporter"]
+    get_guest_model().objects.create_guest_user()
+
+    assert ("increment", "guests_created", 1) in recorded
+    assert [name for kind, name, _v in recorded if kind == "observe"] == [
+        "guest_creation_seconds"
+    ]
@@ -0,0 +1,193 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.utils.timezone import now
+from django.contrib.auth import get_user_model
+from guest_user.functions import (
+    SESSION_GUEST_KEY,
+    GuestUser,
+    get_guest_model,
+    is_guest_user,
+)
+from guest_user.middleware import compile_path_pattern
+
+
+@pytest.fixture
+def guest_middleware(settings):
+    settings.MIDDLEWARE = [
+        *settings.MIDDLEWARE,
+        "guest_user.middleware.GuestUserMiddleware",
+    ]
+    settings.GUEST_USER_MIDDLEWARE_INCLUDE_PATHS = [r"/plain/"]
+    settings.GUEST_USER_MIDDLEWARE_EXCLUDE_PATHS = [r"/plain/static/"]
+
+
+@pytest.mark.parametrize(
+    "include,exclude,path,expected",
+    [
+        (None, [], "/anything/", True),
+        ([], [], "/anything/", False),
+        ([r"/app/"], [], "/app/page/", True),
+        ([r"/app/"], [], "/other/app/", False),
+        ([r"/app/", r"/shop/$"], [], "/shop/", True),
+        ([r"/app/", r"/shop/$"], [], "/shop/cart/", False),
+        (None, [r"/static/", r"/healthz$"], "/static/app.css", False),
+        (None, [r"/static/", r"/healthz$"], "/healthz", False),
+        (None, [r"/static/", r"/healthz$"], "/healthz/deep/", True),
+        ([r"/app/"], [r"/app/api/"], "/app/api/items/", False),
+    ],
+)
+def test_compile_path_pattern(include, exclude, path, expected):
+    pattern = compile_path_pattern(include, exclude)
+    assert bool(pattern.match(path)) is expected
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guest_middleware")
+def test_middleware_creates_guest(client):
+    response = client.get("/plain/")
+    assert response.status_code == 200
+    assert is_guest_user(response.context["user"])
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guest_middleware")
+@pytest.mark.parametrize("url", ["/plain/static/", "/guest_user_required/"])
+def test_middleware_ignores_other_paths(client, url):
+    client.get(url)
+    assert get_guest_model().objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guest_middleware")
+def test_middleware_keeps_authenticated(authenticated_client):
+    response = authenticated_client.get("/plain/")
+    assert response.context["user"].username == "registered_user"
+    assert get_guest_model().objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("guest_middleware")
+def test_middleware_async(async_client):
+    response = async_to_sync(async_client.get)("/plain/")
+    assert response.status_code == 200
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.fixture
+def activity_middleware(settings):
+    settings.MIDDLEWARE = [
+        *settings.MIDDLEWARE,
+        "guest_user.middleware.GuestActivityMiddleware",
+    ]
+    settings.GUEST_USER_ACTIVITY_UPDATE_INTERVAL = 60
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("activity_middleware")
+def test_activity_middleware_without_session(client, settings):
+    """Visitors without a session can still be served cacheable pages."""
+    # allauth's middleware reads the session on every request.
+    settings.MIDDLEWARE = [
+        name
+        for name in settings.MIDDLEWARE
+        if name != "allauth.account.middleware.AccountMiddleware"
+    ]
+    response = client.get("/allow_guest_user/beacon/")
+    assert response.status_code == 200
+    assert "Cookie" not in response.get("Vary", "")
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("activity_middleware")
+def test_activity_middleware_throttles_updates(client, django_assert_num_queries):
+    client.get("/allow_guest_user/")
+    GuestModel = get_guest_model()
+    last_seen = GuestModel.objects.get().last_seen
+    assert last_seen is not None and last_seen <= now()
+
+    # Within the interval, only the session and user are loaded,
+    # starting with the first request after the guest was created.
+    for _i in range(2):
+        with django_assert_num_queries(2):
+            client.get("/plain/")
+    assert GuestModel.objects.get().last_seen == last_seen
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("activity_middleware")
+def test_activity_middleware_extends_expiry(client, settings):
+    settings.GUEST_USER_EXPIRE_INACTIVE = True
+    settings.GUEST_USER_MAX_AGE = 3600
+    settings.GUEST_USER_ACTIVITY_UPDATE_INTERVAL = 0
+    client.get("/allow_guest_user/")
+    GuestModel = get_guest_model()
+    GuestModel.objects.update(expires_at=now())
+
+    client.get("/plain/")
+    guest = GuestModel.objects.get()
+    assert guest.expires_at == guest.last_seen + timedelta(hours=1)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("activity_middleware")
+def test_activity_middleware_ignores_users(authenticated_client):
+    response = authenticated_client.get("/plain/")
+    assert response.status_code == 200
+    assert "_guest_user_last_seen" not in authenticated_client.session
+
+
+@pytest.fixture
+def session_only(settings, guest_middleware):
+    settings.GUEST_USER_SESSION_ONLY = True
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("session_only")
+def test_session_only_guest(client):
+    response = client.get("/plain/")
+    guest = response.context["user"]
+    assert isinstance(guest, GuestUser)
+    assert is_guest_user(guest)
+    assert client.session[SESSION_GUEST_KEY]["username"] == guest.username
+
+    # The guest is restored on paths without guest creation as well.
+    response = client.get("/guest_user_required/")
+    assert response.status_code == 200
+    assert response.context["user"] == guest
+
+    assert get_user_model().objects.count() == 0
+    assert get_guest_model().objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("session_only")
+def test_session_only_guest_async(async_client):
+    response = async_to_sync(async_client.get)("/async/allow_guest_user/")
+    assert response.status_code == 200
+    response = async_to_sync(async_client.get)("/async/guest_user_required/")
+    assert response.status_code == 200
+    assert get_user_model().objects.count() == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("session_only")
+def test_session_only_guest_convert(client):
+    client.get("/plain/")
+    response = client.post(
+        "/convert/",
+        {
+            "username": "converted_user",
+            "password1": "c0mpl3xhunter2",
+            "password2": "c0mpl3xhunter2",
+        },
+    )
+    assert response.status_code == 302
+
+    response = client.get("/convert/success/")
+    user = response.context["user"]
+    assert user.username == "converted_user"
+    assert not is_guest_user(user)
+    assert SESSION_GUEST_KEY not in client.session
+    assert get_guest_model().objects.count() == 0
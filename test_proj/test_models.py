@@ -1,6 +1,16 @@
+from itertools import cycle
+
 import pytest
+from django.contrib.auth import get_user_model
 from guest_user.functions import is_guest_user
 from guest_user.models import Guest
+from guest_user.signals import username_collision
+
+names = cycle(["taken1", "taken2", "free"])
+
+
+def cycling_name_generator():
+    return next(names)
 
 
 @pytest.mark.django_db
@@ -11,6 +21,48 @@ def test_unique_usernames():
     assert guest1.username != guest2.username
 
 
+@pytest.mark.django_db
+def test_unique_usernames_candidates(settings):
+    """Taken usernames are skipped after checking all candidates at once."""
+    settings.GUEST_USER_NAME_GENERATOR = "test_proj.test_models.cycling_name_generator"
+    settings.GUEST_USER_NAME_CANDIDATES = 3
+    UserModel = get_user_model()
+    UserModel.objects.create_user("taken1")
+    UserModel.objects.create_user("taken2")
+
+    collisions = []
+
+    def _handler(sender, **kwargs):
+        collisions.append(kwargs)
+
+    username_collision.connect(_handler)
+    try:
+        guest = Guest.objects.create_guest_user()
+    finally:
+        username_collision.disconnect(_handler)
+
+    assert guest.username == "free"
+    assert collisions == [{"signal": username_collision, "collisions": 2, "retries": 0}]
+
+
+@pytest.mark.django_db
+def test_unique_usernames_collision_signal():
+    collisions = []
+
+    def _handler(sender, **kwargs):
+        collisions.append((kwargs["collisions"], kwargs["retries"]))
+
+    username_collision.connect(_handler)
+    try:
+        Guest.objects.create_guest_user(username="username_conflict")
+        assert collisions == []
+        Guest.objects.create_guest_user(username="username_conflict")
+    finally:
+        username_collision.disconnect(_handler)
+
+    assert collisions == [(1, 1)]
+
+
 @pytest.mark.django_db
 def test_create_guest_user():
     guest = Guest.objects.create_guest_user()
@@ -1,5 +1,6 @@
 import pytest
-from guest_user.functions import get_guest_model
+from guest_user import settings as guest_settings
+from guest_user.functions import get_guest_model, is_blocked_user_agent
 from guest_user.models import GuestManager
 
 from .models import CustomGuest
@@ -38,3 +39,13 @@ def test_setting_model_create(settings):
     guest = get_guest_model().objects.create_guest_user()
     guest_instance = CustomGuest.objects.get(user=guest.pk)
     assert guest_instance.extra_data == "dummy"
+
+
+def test_setting_blocked_user_agents(settings):
+    """The compiled block list is reused until the setting changes."""
+    assert guest_settings.BLOCKED_USER_AGENTS is guest_settings.BLOCKED_USER_AGENTS
+    assert not is_blocked_user_agent("CustomCrawler/1.0")
+
+    settings.GUEST_USER_BLOCKED_USER_AGENTS = ["CustomCrawler"]
+    assert is_blocked_user_agent("CustomCrawler/1.0")
+    assert not is_blocked_user_agent("Googlebot/2.1")
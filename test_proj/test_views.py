@@ -1,5 +1,10 @@
+from unittest import mock
+
 import pytest
-from guest_user.functions import is_guest_user
+from django.contrib.auth import BACKEND_SESSION_KEY, authenticate
+from django.contrib.auth.backends import ModelBackend
+from guest_user.forms import UserCreationForm
+from guest_user.functions import get_guest_model, is_guest_user
 
 
 @pytest.mark.django_db
@@ -40,3 +45,142 @@ def test_convert_view_with_guest(client):
     converted_user = response.context["user"]
     assert guest_user.id == converted_user.id
     assert not is_guest_user(converted_user)
+
+
+class AuthenticatingForm(UserCreationForm):
+    authenticate_on_convert = True
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "form_class,authenticated",
+    [
+        ("guest_user.forms.UserCreationForm", False),
+        ("test_proj.test_views.AuthenticatingForm", True),
+    ],
+)
+def test_convert_view_login(client, settings, form_class, authenticated):
+    settings.GUEST_USER_CONVERT_FORM = form_class
+    client.get("/allow_guest_user/")
+
+    with mock.patch(
+        "guest_user.views.authenticate", wraps=authenticate
+    ) as authenticate_mock:
+        response = client.post(
+            "/convert/",
+            {
+                "username": "converted_user",
+                "password1": "c0mpl3xhunter2",
+                "password2": "c0mpl3xhunter2",
+            },
+        )
+    assert response.status_code == 302
+    assert authenticate_mock.called is authenticated
+    assert (
+        client.session[BACKEND_SESSION_KEY]
+        == "django.contrib.auth.backends.ModelBackend"
+    )
+
+
+class AuthenticateOnlyBackend:
+    """A backend that can't load users for later requests, like django-axes."""
+
+    def authenticate(self, request, **credentials):
+        return None
+
+
+class CustomModelBackend(ModelBackend):
+    pass
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "login_backend,backend",
+    [
+        (None, "django.contrib.auth.backends.ModelBackend"),
+        (
+            "test_proj.test_views.CustomModelBackend",
+            "test_proj.test_views.CustomModelBackend",
+        ),
+    ],
+)
+def test_convert_view_login_backend(client, settings, login_backend, backend):
+    settings.AUTHENTICATION_BACKENDS = [
+        "test_proj.test_views.AuthenticateOnlyBackend",
+        *settings.AUTHENTICATION_BACKENDS,
+        "test_proj.test_views.CustomModelBackend",
+    ]
+    settings.GUEST_USER_CONVERT_LOGIN_BACKEND = login_backend
+    client.get("/allow_guest_user/")
+
+    client.post(
+        "/convert/",
+        {
+            "username": "converted_user",
+            "password1": "c0mpl3xhunter2",
+            "password2": "c0mpl3xhunter2",
+        },
+    )
+    assert client.session[BACKEND_SESSION_KEY] == backend
+    response = client.get("/convert/success/")
+    assert response.context["user"].username == "converted_user"
+
+
+@pytest.mark.django_db
+def test_convert_view_login_without_model_backend(client, settings):
+    """Without a known backend, the user is authenticated with the credentials."""
+    settings.AUTHENTICATION_BACKENDS = [
+        "guest_user.backends.GuestBackend",
+        "test_proj.test_views.CustomModelBackend",
+    ]
+    client.get("/allow_guest_user/")
+
+    with mock.patch(
+        "guest_user.views.authenticate", wraps=authenticate
+    ) as authenticate_mock:
+        client.post(
+            "/convert/",
+            {
+                "username": "converted_user",
+                "password1": "c0mpl3xhunter2",
+                "password2": "c0mpl3xhunter2",
+            },
+        )
+    assert authenticate_mock.called
+    assert (
+        client.session[BACKEND_SESSION_KEY] == "test_proj.test_views.CustomModelBackend"
+    )
+
+
+@pytest.mark.django_db
+def test_beacon(client, settings):
+    # allauth's middleware reads the session on every request.
+    settings.MIDDLEWARE = [
+        name
+        for name in settings.MIDDLEWARE
+        if name != "allauth.account.middleware.AccountMiddleware"
+    ]
+    response = client.get("/allow_guest_user/beacon/")
+    assert response.status_code == 200
+    assert response.context["user"].is_anonymous
+    assert settings.SESSION_COOKIE_NAME not in response.cookies
+    assert "Cookie" not in response.get("Vary", "")
+    assert b'fetch("/convert/beacon/"' in response.content
+
+    response = client.post("/convert/beacon/")
+    assert response.status_code == 204
+    assert settings.SESSION_COOKIE_NAME in response.cookies
+    assert get_guest_model().objects.count() == 1
+
+    # Calling the beacon again keeps the guest.
+    client.post("/convert/beacon/")
+    response = client.get("/allow_guest_user/beacon/")
+    assert is_guest_user(response.context["user"])
+    assert get_guest_model().objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_beacon_requires_post(client):
+    response = client.get("/convert/beacon/")
+    assert response.status_code == 405
+    assert get_guest_model().objects.count() == 0
@@ -5,14 +5,33 @@ from . import views
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("plain/", views.plain_view),
+    path("plain/static/", views.plain_view),
     # Function view decorators
     path("allow_guest_user/", views.allow_guest_user_view),
+    path("allow_guest_user/lazy/", views.allow_guest_user_lazy_view),
+    path("allow_guest_user/lazy/form/", views.allow_guest_user_lazy_form_view),
+    path("allow_guest_user/beacon/", views.allow_guest_user_beacon_view),
     path("guest_user_required/", views.guest_user_required_view),
     path("regular_user_required/", views.regular_user_required_view),
     # Class based views with mixins
     path("mixin/allow_guest_user/", views.AllowGuestUserView.as_view()),
+    path("mixin/allow_guest_user/lazy/", views.AllowGuestUserLazyView.as_view()),
     path("mixin/guest_user_required/", views.GuestUserRequiredView.as_view()),
     path("mixin/regular_user_required/", views.RegularUserRequiredView.as_view()),
+    # Async views
+    path("async/allow_guest_user/", views.async_allow_guest_user_view),
+    path("async/guest_user_required/", views.async_guest_user_required_view),
+    path("async/regular_user_required/", views.async_regular_user_required_view),
+    path("async/mixin/allow_guest_user/", views.AsyncAllowGuestUserView.as_view()),
+    path(
+        "async/mixin/guest_user_required/",
+        views.AsyncGuestUserRequiredView.as_view(),
+    ),
+    path(
+        "async/mixin/regular_user_required/",
+        views.AsyncRegularUserRequiredView.as_view(),
+    ),
     # Conversion view
     path("convert/", include("guest_user.urls")),
 ]
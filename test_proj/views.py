@@ -1,3 +1,4 @@
+from django.http import HttpResponse
 from django.shortcuts import render
 from django.views.generic import View
 from guest_user.decorators import (
@@ -12,16 +13,51 @@ from guest_user.mixins import (
 )
 
 
+def plain_view(request):
+    return render(request, "guest.html")
+
+
 @allow_guest_user()
 def allow_guest_user_view(request):
     return render(request, "guest.html")
 
 
+def lazy_guest_response(request):
+    """Only use the guest user when asked to."""
+    if "pk" in request.GET:
+        return HttpResponse(request.user.pk)
+    return HttpResponse(request.user.is_authenticated)
+
+
+@allow_guest_user(lazy=True)
+def allow_guest_user_lazy_view(request):
+    return lazy_guest_response(request)
+
+
+@allow_guest_user(lazy=True)
+def allow_guest_user_lazy_form_view(request):
+    if request.method == "POST":
+        return HttpResponse(request.user.username)
+    return render(request, "lazy_form.html")
+
+
+@allow_guest_user(beacon=True)
+def allow_guest_user_beacon_view(request):
+    return render(request, "beacon.html")
+
+
 class AllowGuestUserView(AllowGuestUserMixin, View):
     def get(self, request):
         return render(request, "guest.html")
 
 
+class AllowGuestUserLazyView(AllowGuestUserMixin, View):
+    lazy = True
+
+    def get(self, request):
+        return lazy_guest_response(request)
+
+
 @guest_user_required()
 def guest_user_required_view(request):
     return render(request, "guest.html")
@@ -40,3 +76,36 @@ def regular_user_required_view(request):
 class RegularUserRequiredView(RegularUserRequiredMixin, View):
     def get(self, request):
         return render(request, "guest.html")
+
+
+# Async views
+
+
+@allow_guest_user
+async def async_allow_guest_user_view(request):
+    return render(request, "guest.html")
+
+
+class AsyncAllowGuestUserView(AllowGuestUserMixin, View):
+    async def get(self, request):
+        return render(request, "guest.html")
+
+
+@guest_user_required
+async def async_guest_user_required_view(request):
+    return render(request, "guest.html")
+
+
+class AsyncGuestUserRequiredView(GuestUserRequiredMixin, View):
+    async def get(self, request):
+        return render(request, "guest.html")
+
+
+@regular_user_required
+async def async_regular_user_required_view(request):
+    return render(request, "guest.html")
+
+
+class AsyncRegularUserRequiredView(RegularUserRequiredMixin, View):
+    async def get(self, request):
+        return render(request, "guest.html")